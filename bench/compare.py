@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Compare two benchmark result files from bench/driver.py
+
+Run: python3 -m bench.compare bench/results/OLD.json bench/results/NEW.json
+"""
+import argparse
+import json
+from pathlib import Path
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "throughput_rps", "peak_rss_mb")
+
+
+def change(old, new):
+    if old is None or new is None:
+        return "-"
+    if old == 0:
+        return f"{new}"
+    return f"{new} ({(new - old) / old * 100:+.0f}%)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("old", type=Path)
+    parser.add_argument("new", type=Path)
+    args = parser.parse_args()
+
+    old = json.loads(args.old.read_text())
+    new = json.loads(args.new.read_text())
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    print(f"overall: {change(old['throughput_rps'], new['throughput_rps'])} req/s")
+
+    for route in sorted(set(old["routes"]) | set(new["routes"])):
+        before, after = old["routes"].get(route, {}), new["routes"].get(route, {})
+        print(f"\n{route}")
+        for metric in METRICS:
+            print(f"  {metric:<15} {before.get(metric, '-')!s:>10} -> {change(before.get(metric), after.get(metric))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Replay a weighted mix of the app's routes and report latency per route
+
+Requests go through the Flask test client (in-process, default) or over HTTP
+to a running server (e.g. gunicorn). Results are written as JSON so runs on
+different commits can be compared with bench/compare.py.
+
+Run: python3 -m bench.driver --requests 2000 --concurrency 8 [--base-url http://localhost:8000 --server-pid 1234]
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+
+from utils.psql import psql
+from bench.seed import synthetic_video
+
+# route -> weight, roughly what event-night traffic looks like
+DEFAULT_MIX = {
+    "/": 30,
+    "/leaderboard": 20,
+    "/history": 15,
+    "/profile/<id>": 15,
+    "/video/<id>": 15,
+    "/upload": 5,
+}
+
+RESULTS_DIR = Path(__file__).parent / "results"
+# User and run ids the requests are spread over
+ID_SAMPLE = 1000
+
+
+def parse_mix(text):
+    """'/:40,/leaderboard:20' -> {'/': 40, '/leaderboard': 20}"""
+    mix = {}
+    for part in text.split(","):
+        route, weight = part.rsplit(":", 1)
+        mix[route.strip()] = int(weight)
+    return mix
+
+
+def rss_bytes(pid="self"):
+    """Current resident set size of a process (Linux)"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(int(round(pct / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class TestClientTarget:
+    """Requests through Flask's test client, in this process"""
+
+    def __init__(self):
+        from main import app
+        self.app = app
+        self.local = threading.local()
+        self.pid = "self"
+
+    def request(self, method, path, data=None):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, data=data)
+        response.get_data()  # drain streamed bodies (videos)
+        response.close()
+        return response.status_code
+
+
+class HttpTarget:
+    """Requests over HTTP to a running server"""
+
+    def __init__(self, base_url, server_pid=None):
+        self.base_url = base_url.rstrip("/")
+        self.pid = server_pid
+
+    def request(self, method, path, data=None):
+        body, headers = None, {}
+        if data is not None:
+            body, content_type = encode_multipart(data)
+            headers["Content-Type"] = content_type
+
+        req = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req) as response:
+                while response.read(64 * 1024):
+                    pass
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+def encode_multipart(data):
+    boundary = f"bench{random.getrandbits(64):x}"
+    out = io.BytesIO()
+    for name, value in data.items():
+        out.write(f"--{boundary}\r\n".encode())
+        if isinstance(value, tuple):
+            fileobj, filename = value
+            out.write(f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'.encode())
+            out.write(b"Content-Type: application/octet-stream\r\n\r\n")
+            out.write(fileobj.read())
+        else:
+            out.write(f'Content-Disposition: form-data; name="{name}"\r\n\r\n{value}'.encode())
+        out.write(b"\r\n")
+    out.write(f"--{boundary}--\r\n".encode())
+    return out.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+
+def build_request(route, rng, ids, upload_kb):
+    """Turn a route template from the mix into (method, path, data)"""
+    if route == "/profile/<id>":
+        return "GET", f"/profile/{rng.choice(ids['users'])}", None
+    if route == "/video/<id>":
+        return "GET", f"/video/{rng.choice(ids['runs'])}", None
+    if route == "/upload":
+        data = {
+            "username": f"bench_upload_{rng.randint(1, 50)}",
+            "description": "benchmark upload",
+            "time_seconds": f"{rng.uniform(4, 40):.2f}",
+            "video": (io.BytesIO(synthetic_video(rng, upload_kb * 1024)), "bench.mp4"),
+        }
+        return "POST", "/upload", data
+    return "GET", route, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. '/:40,/leaderboard:20,/video/<id>:10'")
+    parser.add_argument("--base-url", help="benchmark a running server instead of the in-process test client")
+    parser.add_argument("--server-pid", help="with --base-url: sample this process's RSS")
+    parser.add_argument("--upload-kb", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="result JSON (default bench/results/<time>-<commit>.json)")
+    args = parser.parse_args()
+
+    target = HttpTarget(args.base_url, args.server_pid) if args.base_url else TestClientTarget()
+    rng = random.Random(args.seed)
+    # Ids read in a fixed order and sampled with the seeded rng, so the same data and --seed pick the same targets
+    user_ids = [row[0] for row in psql("SELECT user_id FROM users ORDER BY user_id;")]
+    run_ids = [row[0] for row in psql("SELECT run_id FROM runs ORDER BY run_id;")]
+    if not user_ids or not run_ids:
+        raise SystemExit("No data to benchmark against, run python3 -m bench.seed first.")
+    ids = {
+        "users": rng.sample(user_ids, min(ID_SAMPLE, len(user_ids))),
+        "runs": rng.sample(run_ids, min(ID_SAMPLE, len(run_ids))),
+    }
+
+    routes, weights = zip(*args.mix.items())
+    plan = rng.choices(routes, weights=weights, k=args.requests)
+
+    results = {route: {"latencies": [], "errors": 0, "peak_rss": 0} for route in routes}
+    lock = threading.Lock()
+    cursor = iter(enumerate(plan))
+
+    def worker():
+        while True:
+            with lock:
+                item = next(cursor, None)
+            if item is None:
+                return
+            index, route = item
+            # Seeded by position in the plan, so the same --seed sends the same requests
+            # no matter which thread happens to pick each one up
+            request_rng = random.Random(f"{args.seed}-{index}")
+            method, path, data = build_request(route, request_rng, ids, args.upload_kb)
+            started = time.perf_counter()
+            try:
+                status = target.request(method, path, data)
+            except Exception:
+                status = None
+            elapsed = time.perf_counter() - started
+            rss = rss_bytes(target.pid) if target.pid else None
+            with lock:
+                stats = results[route]
+                stats["latencies"].append(elapsed)
+                if status is None or status >= 400:
+                    stats["errors"] += 1
+                if rss:
+                    stats["peak_rss"] = max(stats["peak_rss"], rss)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "target": args.base_url or "test_client",
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "mix": args.mix,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(args.requests / wall, 2),
+        "routes": {},
+    }
+    for route, stats in results.items():
+        latencies = sorted(stats["latencies"])
+        report["routes"][route] = {
+            "count": len(latencies),
+            "errors": stats["errors"],
+            "throughput_rps": round(len(latencies) / wall, 2),
+            "p50_ms": ms(percentile(latencies, 50)),
+            "p95_ms": ms(percentile(latencies, 95)),
+            "p99_ms": ms(percentile(latencies, 99)),
+            "max_ms": ms(latencies[-1] if latencies else None),
+            "peak_rss_mb": round(stats["peak_rss"] / 2**20, 1) if stats["peak_rss"] else None,
+        }
+
+    output = args.output or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}-{report['commit'] or 'nogit'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+
+    print(f"{'route':<16} {'count':>6} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'rss MB':>7}")
+    for route, stats in report["routes"].items():
+        print(f"{route:<16} {stats['count']:>6} {stats['errors']:>4} {fmt(stats['p50_ms']):>8} "
+              f"{fmt(stats['p95_ms']):>8} {fmt(stats['p99_ms']):>8} {fmt(stats['peak_rss_mb']):>7}")
+    print(f"{report['throughput_rps']} req/s overall, saved to {output}")
+
+
+def ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def fmt(value):
+    return "-" if value is None else str(value)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    main()
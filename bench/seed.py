@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Bulk-load synthetic users and runs into the local database for benchmarking
+
+Users and runs are streamed in with COPY. Media is a small pool of distinct
+synthetic videos and pictures of configurable size, written to the blob
+store once and shared between rows (the store dedupes by content anyway).
+
+Run: python3 -m bench.seed --users 1000 --runs 20000 [--video-kb 2048] [--truncate]
+"""
+import argparse
+import csv
+import io
+import random
+from datetime import datetime, timedelta
+
+from PIL import Image
+
+from utils.psql import psql, psql_copy, transaction, IteratorFile
+from utils.blobstore import get_blob_store
+from utils.images import make_avatar_variants
+
+
+def synthetic_video(rng, size):
+    """Random bytes behind an MP4 'ftyp' box, so uploads sniff as video/mp4"""
+    header = b"\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom"
+    return header + rng.randbytes(max(size - len(header), 0))
+
+
+def synthetic_picture(rng, size):
+    """Noisy JPEG of roughly `size` bytes (noise doesn't compress, so size tracks pixels)"""
+    side = max(int((size / 1.5) ** 0.5), 16)
+    img = Image.frombytes("RGB", (side, side), rng.randbytes(side * side * 3))
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def csv_lines(rows):
+    """Yield rows as CSV text for COPY ... WITH (FORMAT csv)"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow(["" if value is None else value for value in row])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--video-kb", type=int, default=1024, help="size of each synthetic video")
+    parser.add_argument("--picture-kb", type=int, default=200, help="size of each synthetic profile picture")
+    parser.add_argument("--distinct-media", type=int, default=10, help="how many different videos/pictures to generate")
+    parser.add_argument("--picture-ratio", type=float, default=0.5, help="share of users with a profile picture")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--truncate", action="store_true", help="delete all existing users and runs first")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    store = get_blob_store()
+
+    print(f"Generating {args.distinct_media} videos and pictures...")
+    videos = [store.put_chunks([synthetic_video(rng, args.video_kb * 1024)]) for _ in range(args.distinct_media)]
+    pictures = []
+    for _ in range(args.distinct_media):
+        picture = store.put_chunks([synthetic_picture(rng, args.picture_kb * 1024)])
+        variants = [
+            (size, fmt, store.put_chunks([data]), mime)
+            for size, fmt, mime, data in make_avatar_variants(store.path(picture.digest))
+        ]
+        pictures.append((picture, variants))
+
+    if args.truncate:
+        with transaction() as tx:
+            tx.execute("TRUNCATE runs, users, user_stats, avatar_variants;", fetch=False)
+            tx.execute("UPDATE site_state SET runs_total = 0 WHERE id = 1;", fetch=False)
+
+    first_id = psql("SELECT COALESCE(MAX(user_id), 0) + 1 AS next_id FROM users;")[0]["next_id"]
+    user_ids = range(first_id, first_id + args.users)
+    user_pictures = {
+        user_id: rng.choice(pictures) for user_id in user_ids if rng.random() < args.picture_ratio
+    }
+
+    def users():
+        for user_id in user_ids:
+            picture = user_pictures.get(user_id)
+            name = f"bench_{user_id:07d}"
+            yield (
+                user_id, name, name,
+                picture[0].digest if picture else None,
+                picture[0].size if picture else None,
+                "image/jpeg" if picture else None,
+            )
+
+    def variants():
+        for user_id, (_, user_variants) in user_pictures.items():
+            for size, fmt, blob, mime in user_variants:
+                yield user_id, size, fmt, blob.digest, blob.size, mime
+
+    now = datetime.now()
+
+    def runs():
+        for _ in range(args.runs):
+            video = rng.choice(videos)
+            run_date = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+            yield (
+                rng.choice(user_ids), "benchmark run", round(rng.uniform(4, 40), 2),
+                run_date.isoformat(sep=" "), video.digest, video.size, "video/mp4",
+            )
+
+    print(f"Loading {args.users} users and {args.runs} runs...")
+    psql_copy(
+        "COPY users (user_id, username, username_lower, profile_picture_sha256, profile_picture_size, profile_picture_mime) FROM STDIN WITH (FORMAT csv);",
+        IteratorFile(csv_lines(users())),
+    )
+    psql("SELECT setval('users_user_id_seq', (SELECT MAX(user_id) FROM users));")
+    psql_copy(
+        "COPY avatar_variants (user_id, size, format, sha256, bytes, mime) FROM STDIN WITH (FORMAT csv);",
+        IteratorFile(csv_lines(variants())),
+    )
+    # Row triggers fire for COPY too, so user_stats and site_state stay correct
+    psql_copy(
+        "COPY runs (user_id, description, time_seconds, run_date, video_sha256, video_size, video_mime) FROM STDIN WITH (FORMAT csv);",
+        IteratorFile(csv_lines(runs())),
+    )
+    psql("ANALYZE users; ANALYZE runs; ANALYZE user_stats;", fetch=False)
+    print("Done.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Build the static files for production: fingerprinted names, AVIF/WebP images, precompressed CSS/JS
+
+`build` copies static/ to static/dist under content-hashed names, adds smaller
+AVIF/WebP versions of the images and .gz/.br versions of the text files, and
+writes static/dist/manifest.json. The app picks the manifest up at startup:
+url_for('static', ...) then points at the hashed files, served with immutable
+caching. Run it again (and restart) after changing anything in static/.
+
+`prepare` does the image editing the bong pictures went through (rotate, crop
+a share of each side, resize to match another image), e.g. from the *_original.png files.
+
+Run: python3 build_assets.py [build] [--clean]
+     python3 build_assets.py prepare SRC DEST [--rotate 90] [--crop L T R B] [--match IMAGE]
+"""
+import argparse
+import shutil
+from pathlib import Path
+
+from PIL import Image
+
+from utils.assets import DIST_DIR, build, prepare_image
+
+STATIC_FOLDER = Path(__file__).parent / "static"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command")
+    build_parser = commands.add_parser("build", help="build static/dist (default)")
+    build_parser.add_argument("--clean", action="store_true",
+                              help="delete earlier builds first (pages cached by browsers may still refer to them)")
+    prepare_parser = commands.add_parser("prepare", help="edit an image")
+    prepare_parser.add_argument("src")
+    prepare_parser.add_argument("dest")
+    prepare_parser.add_argument("--rotate", type=int, default=0, help="degrees clockwise")
+    prepare_parser.add_argument("--crop", type=float, nargs=4, metavar=("LEFT", "TOP", "RIGHT", "BOTTOM"),
+                                help="share of the width/height to cut off each side, e.g. 0 0.1 0 0.1")
+    prepare_parser.add_argument("--match", metavar="IMAGE", help="resize to the size of this image")
+    args = parser.parse_args()
+
+    if args.command == "prepare":
+        size = None
+        if args.match:
+            with Image.open(args.match) as other:
+                size = other.size
+        prepare_image(args.src, args.dest, rotate=args.rotate, crop=args.crop, size=size)
+        print(f"Wrote {args.dest}.")
+        return
+
+    if getattr(args, "clean", False):
+        shutil.rmtree(STATIC_FOLDER / DIST_DIR, ignore_errors=True)
+    manifest = build(STATIC_FOLDER)
+    print(f"Built {len(manifest['files'])} files into static/{DIST_DIR}.")
+
+
+if __name__ == "__main__":
+    main()
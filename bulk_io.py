@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Export or import users and runs with COPY, e.g. to move a season between environments
+
+Tables are written as CSV or NDJSON (picked from the file extension), a bundle
+is a tar with users.csv, runs.csv and optionally media/<sha256> blobs.
+Without a file, export writes to stdout and import reads from stdin.
+
+Run: python3 bulk_io.py export|import users|runs|bundle [file] [-o out] [--format ndjson] [--media]
+"""
+import argparse
+import sys
+from contextlib import nullcontext
+
+from utils.bulk import export_table, export_bundle, import_table, import_bundle, ndjson_or_csv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("table", choices=["users", "runs", "bundle"])
+    parser.add_argument("file", nargs="?", help="file to import (default stdin)")
+    parser.add_argument("-o", "--output", help="file to export to (default stdout)")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="default: from the file extension, else csv")
+    parser.add_argument("--media", action="store_true", help="bundle export: include videos and pictures")
+    args = parser.parse_args()
+
+    if args.action == "export":
+        out = open(args.output, "wb") if args.output else nullcontext(sys.stdout.buffer)
+        with out as fileobj:
+            if args.table == "bundle":
+                export_bundle(fileobj, media=args.media)
+            else:
+                export_table(args.table, args.format or ndjson_or_csv(args.output), fileobj)
+        return
+
+    source = open(args.file, "rb") if args.file else nullcontext(sys.stdin.buffer)
+    with source as fileobj:
+        if args.table == "bundle":
+            counts = import_bundle(fileobj)
+        else:
+            counts = {args.table: import_table(args.table, args.format or ndjson_or_csv(args.file), fileobj)}
+    print("Imported " + ", ".join(f"{count} {name}" for name, count in counts.items()) + ".", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
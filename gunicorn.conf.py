@@ -0,0 +1,38 @@
+"""
+Gunicorn settings, read automatically when gunicorn starts in this directory
+
+The database pool connects lazily and is reset in every forked worker, so the
+app can be preloaded in the master (GUNICORN_PRELOAD=1): workers fork with the
+code already imported and open their own connections. DB_POOL_WARMUP=1 makes
+each worker open DB_POOL_MIN connections in the background right after forking,
+so the first requests don't pay for the connection setup.
+
+Every open /events stream (live updates) occupies a worker thread while it is
+connected, so workers are gthread ones (a sync worker would be taken by a single
+open front page, and killed by its timeout). Each worker keeps up to
+EVENTS_MAX_CLIENTS streams open; further watchers poll every EVENTS_POLL_SECONDS
+or so instead, from the same in-memory state, so any number of watchers costs no
+queries. Stream slots scale with workers * EVENTS_MAX_CLIENTS; raise it together
+with GUNICORN_THREADS for more live streams.
+
+The remaining threads serve pages, and each page request holds a database
+connection, so the default gives every worker DB_POOL_MAX page threads: more
+would only wait for a connection and fail with PoolTimeout under load.
+
+Run: gunicorn main:app [--workers 4]
+"""
+import os
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1"
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+# Threads per worker: one per pooled database connection for pages, plus the /events streams
+threads = int(os.getenv("GUNICORN_THREADS", int(os.getenv("DB_POOL_MAX", "10")) + int(os.getenv("EVENTS_MAX_CLIENTS", "16"))))
+
+
+def post_fork(server, worker):
+    from utils.psql import reinit_after_fork, warm_up
+
+    # os.register_at_fork already did this, but be explicit for forks it can't see
+    reinit_after_fork()
+    if os.getenv("DB_POOL_WARMUP", "0") == "1":
+        warm_up()
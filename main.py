@@ -1,22 +1,43 @@
-from flask import Flask, request, render_template, redirect, url_for, send_file, session, flash
-from utils.psql import psql
-import psycopg2  # needed for psycopg2.Binary
+from flask import Flask, Response, request, render_template, redirect, url_for, send_file, session, flash, jsonify
+from utils.psql import psql, transaction, init_app as init_db, pool_stats, replica_stats
+from utils.media import stream_video, not_modified, set_cache_headers, media_version
+from utils.blobstore import get_blob_store
+from utils.uploads import IngestRequest, MAX_UPLOAD_BYTES, ingest_upload
+from utils.sitestate import SiteState
+from utils.images import pick_avatar_size
+from utils.jobs import enqueue, queue_stats
+from utils.metrics import init_app as init_metrics, render_prometheus
+from utils.assets import init_app as init_assets
+from utils.pagecache import page_cache
+from utils.events import create_broker, notify
+from utils.auth import RateLimiter, LoginThrottled, VerifierUnavailable, create_verifier
+from utils.bulk import EXPORTS, FORMATS, export_table, export_bundle, import_table, import_bundle, stream_writer, ndjson_or_csv
+from psycopg2 import errors
+from werkzeug.middleware.proxy_fix import ProxyFix
 import io
-import os, hashlib, hmac
+import os, math, secrets
 from pathlib import Path
-import mimetypes
-from functools import wraps
-import json
+from functools import lru_cache, wraps
+from datetime import date, datetime, timedelta
 
 CONFIG_FILE = Path("config.json")
 
+# Cached run counter + config, shared by all requests in this worker
+site_state = SiteState(CONFIG_FILE)
+
 def get_config():
-    if CONFIG_FILE.exists():
-        return json.loads(CONFIG_FILE.read_text())
-    return {"goal": 100}
+    return site_state.get_config()
 
 def save_config(config):
-    CONFIG_FILE.write_text(json.dumps(config, indent=2))
+    site_state.save_config(config)
+
+def live_state():
+    # Read when the /events listener (re)connects, so skip the cached copy
+    site_state.invalidate()
+    return {"total_runs": site_state.get_total_runs(), "goal": get_config()["goal"]}
+
+# Live total/goal/new-run updates for /events, one LISTEN connection per worker
+events = create_broker(live_state)
 
 # naive loader (or use python-dotenv to load .env into os.environ)
 def load_env_to_os(path=Path(".env")):
@@ -28,24 +49,57 @@ def load_env_to_os(path=Path(".env")):
             os.environ.setdefault(k.strip(), v.strip())
 load_env_to_os()
 
-ADMIN_SALT = bytes.fromhex(os.getenv("ADMIN_SALT"))
-ADMIN_HASH = bytes.fromhex(os.getenv("ADMIN_HASH"))
-ADMIN_ITER = int(os.getenv("ADMIN_ITER", "200000"))
+@lru_cache(maxsize=1)
+def admin_credentials():
+    """(salt, hash, iterations) from the env, decoded on the first login instead of at import"""
+    salt, hashed = os.getenv("ADMIN_SALT"), os.getenv("ADMIN_HASH")
+    if not salt or not hashed:
+        raise RuntimeError("ADMIN_SALT / ADMIN_HASH not set, run gen_admin_credentials.py")
+    return bytes.fromhex(salt), bytes.fromhex(hashed), int(os.getenv("ADMIN_ITER", "200000"))
 
-def is_admin_password_ok(plain_password: str) -> bool:
-    derived = hashlib.pbkdf2_hmac("sha256", plain_password.encode("utf-8"), ADMIN_SALT, ADMIN_ITER)
-    return hmac.compare_digest(derived, ADMIN_HASH)
+# PBKDF2 runs in a small process pool, throttled per client IP and overall (per worker)
+password_verifier = create_verifier(admin_credentials)
+login_limiter = RateLimiter()
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
+# Proxies in front of the app (Render has one) whose X-Forwarded-For/-Proto are trusted,
+# so request.remote_addr is the client (the login rate limit is per client); 0 if clients connect directly
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", "1"))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+# Uploaded files are streamed into the blob store while the request is parsed
+app.request_class = IngestRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+# One pooled DB connection per request, released on teardown
+init_db(app)
+# Per-request query count/DB time (Server-Timing header) and latency histograms
+init_metrics(app)
+# Fingerprinted, precompressed static files from build_assets.py (if it was run)
+init_assets(app)
+# Content version for media URLs, e.g. url_for('video', run_id=..., v=media_version(run.video_sha256))
+app.jinja_env.globals["media_version"] = media_version
 
 @app.route("/")
+@page_cache.cached("runs", "config")
 def index():
     config = get_config()
-    total_runs = psql("SELECT COUNT(*) FROM runs;")[0][0]
+    total_runs = site_state.get_total_runs()
     return render_template("index.html", total_runs=total_runs, goal=config["goal"])
 
 
+@app.route("/events")
+def events_stream():
+    # Server-sent events; the stream never touches the database itself
+    subscriber = events.subscribe()
+    return Response(
+        # Over EVENTS_MAX_CLIENTS the client gets the state once and polls
+        events.stream(subscriber) if subscriber else events.poll(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.route("/info")
 def info():
     return render_template("info.html")
@@ -58,8 +112,19 @@ def info():
 @app.route("/admin/login", methods=["GET", "POST"])
 def admin_login():
     if request.method == "POST":
-        password = request.form.get("password")
-        if is_admin_password_ok(password):
+        password = request.form.get("password", "")
+        try:
+            # Checked before any hashing, so flooding the form costs next to nothing
+            login_limiter.check(request.remote_addr)
+            ok = password_verifier.verify(password, session.setdefault("login_id", secrets.token_hex(16)))
+        except LoginThrottled as e:
+            retry_after = math.ceil(e.retry_after)
+            flash(f"🐢 Too many login attempts, try again in {retry_after} s", "warning")
+            return render_template("admin/login.html"), 429, {"Retry-After": str(retry_after)}
+        except VerifierUnavailable:
+            flash("⚠️ Couldn't check the password right now, please try again", "warning")
+            return render_template("admin/login.html"), 503, {"Retry-After": "1"}
+        if ok:
             session["admin_logged_in"] = True
             flash("✅ Logged in as admin!", "success")
             return redirect(url_for("admin_dashboard"))
@@ -77,13 +142,101 @@ def admin_required(f):
         return f(*args, **kwargs)
     return wrapper
 
+DASHBOARD_PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "50"))
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+def like_prefix(text):
+    """Escape LIKE wildcards in text and turn it into a prefix pattern"""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def keyset_page(select, key, where, params, after=None, before=None, limit=50):
+    """
+    Fetch one page of `select` ordered by the unique column `key`, using the
+    seek method (WHERE key > last seen) instead of OFFSET, so every page is an
+    index range scan no matter how deep it is.
+    Returns (rows, has_prev, has_next).
+    """
+    where, params = list(where), list(params)
+    if before is not None:
+        where.append(f"{key} < %s")
+        params.append(before)
+        order = "DESC"
+    else:
+        if after is not None:
+            where.append(f"{key} > %s")
+            params.append(after)
+        order = "ASC"
+
+    query = select
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += f" ORDER BY {key} {order} LIMIT %s;"
+    rows = psql(query, tuple(params) + (limit + 1,))
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+        return rows, more, True
+    return rows, after is not None, more
+
 @app.route("/admin/dashboard")
 @admin_required
 def admin_dashboard():
     # Only visible to logged-in admin
-    users = psql("SELECT * FROM users ORDER BY user_id;")
-    runs = psql("SELECT * FROM runs ORDER BY run_id;")
-    return render_template("admin/dashboard.html", users=users, runs=runs)
+    page_size = min(max(request.args.get("page_size", DASHBOARD_PAGE_SIZE, type=int), 1), 500)
+    username = request.args.get("user", "").strip()
+    date_from = parse_date(request.args.get("from"))
+    date_to = parse_date(request.args.get("to"))
+
+    # Users: optional username prefix filter
+    user_where, user_params = [], []
+    if username:
+        user_where.append("username_lower LIKE %s")
+        user_params.append(like_prefix(username.lower()))
+    users, users_prev, users_next = keyset_page(
+        "SELECT user_id, username FROM users", "user_id", user_where, user_params,
+        request.args.get("users_after", type=int), request.args.get("users_before", type=int), page_size,
+    )
+
+    # Runs: optional exact user and date range filters
+    run_where, run_params = [], []
+    if username:
+        run_where.append("user_id = (SELECT user_id FROM users WHERE username_lower = LOWER(%s))")
+        run_params.append(username)
+    if date_from:
+        run_where.append("run_date >= %s")
+        run_params.append(date_from)
+    if date_to:
+        run_where.append("run_date < %s")
+        run_params.append(date_to + timedelta(days=1))
+    runs, runs_prev, runs_next = keyset_page(
+        "SELECT run_id, user_id, description, time_seconds, run_date, processing_status FROM runs", "run_id", run_where, run_params,
+        request.args.get("runs_after", type=int), request.args.get("runs_before", type=int), page_size,
+    )
+
+    def page_url(**changes):
+        args = request.args.to_dict()
+        for key, value in changes.items():
+            if value is None:
+                args.pop(key, None)
+            else:
+                args[key] = value
+        return url_for("admin_dashboard", **args)
+
+    return render_template(
+        "admin/dashboard.html",
+        users=users, users_prev=users_prev, users_next=users_next,
+        runs=runs, runs_prev=runs_prev, runs_next=runs_next,
+        filters={"user": username, "from": date_from, "to": date_to, "page_size": page_size},
+        page_url=page_url,
+        jobs=queue_stats(),
+    )
 
 @app.route("/admin/logout")
 def admin_logout():
@@ -99,26 +252,123 @@ def admin_settings():
         config = get_config()
         config["goal"] = new_goal
         save_config(config)
+        notify("config", goal=new_goal)
+        page_cache.invalidate("config")
         flash("✅ Goal updated!", "success")
         return redirect(url_for("admin_dashboard"))
     
     config = get_config()
-    current_runs = psql("SELECT COUNT(*) FROM runs;")[0][0]
+    current_runs = site_state.get_total_runs()
     return render_template("admin/settings.html", config=config, current_runs=current_runs)
+@app.route("/admin/metrics")
+@admin_required
+def admin_metrics():
+    # Prometheus text format, for this worker only
+    gauges = {f"db_pool_{key}": value for key, value in pool_stats().items()}
+    replication = replica_stats()
+    gauges.update({f"db_{key}": value for key, value in replication.items() if key != "replicas"})
+    for index, replica in enumerate(replication["replicas"]):
+        gauges.update({f"db_replica{index}_{key}": float(value) for key, value in replica.items() if key != "host"})
+    gauges.update({f"jobs_{status}": count for status, count in queue_stats().items()})
+    gauges.update({f"page_cache_{key}": value for key, value in page_cache.stats().items() if value is not None})
+    gauges["events_clients"] = len(events.subscribers)
+    return render_prometheus(gauges), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+@app.route("/admin/db/pool")
+@admin_required
+def admin_db_pool():
+    # Connection pool usage, for sizing DB_POOL_MAX against gunicorn threads
+    return jsonify({**pool_stats(), "replication": replica_stats()})
+
+@app.route("/admin/cache")
+@admin_required
+def admin_cache():
+    # Page cache hit/miss counters of this worker
+    return jsonify(page_cache.stats())
+
+# -----------------------
+# BULK EXPORT / IMPORT
+# -----------------------
+@app.route("/admin/export")
+@admin_required
+def admin_export():
+    # ?table=users|runs&format=csv|ndjson, or ?table=bundle[&media=1] for a tar
+    table = request.args.get("table", "runs")
+    if table == "bundle":
+        media = request.args.get("media") == "1"
+        body = stream_writer(lambda out: export_bundle(out, media=media))
+        mimetype, filename = "application/x-tar", f"usainbolt-{date.today()}.tar"
+    elif table in EXPORTS:
+        fmt = request.args.get("format", "csv")
+        if fmt not in FORMATS:
+            return "Unknown format", 400
+        mimetype, extension = FORMATS[fmt]
+        body = stream_writer(lambda out: export_table(table, fmt, out))
+        filename = f"{table}-{date.today()}.{extension}"
+    else:
+        return "Unknown table", 400
+
+    response = app.response_class(body, mimetype=mimetype)
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+@app.route("/admin/import", methods=["GET", "POST"])
+@admin_required
+def admin_import():
+    if request.method == "POST":
+        table = request.form.get("table", "runs")
+        file = request.files.get("file")
+        if not file or not file.filename or table not in ("users", "runs", "bundle"):
+            flash("❌ Choose a file and what it contains.", "danger")
+            return redirect(url_for("admin_import"))
+
+        file.stream.seek(0)
+        try:
+            if table == "bundle":
+                counts = import_bundle(file.stream)
+            else:
+                counts = {table: import_table(table, ndjson_or_csv(file.filename), file.stream)}
+        except (ValueError, errors.DataError, errors.IntegrityError) as e:
+            # Bad headers, values COPY can't parse (e.g. text in time_seconds) or rows missing required fields
+            flash(f"❌ Import failed: {str(e).splitlines()[0]}", "danger")
+            return redirect(url_for("admin_import"))
+        site_state.invalidate()
+        page_cache.clear()
+        summary = ", ".join(f"{count} {name}" for name, count in counts.items())
+        flash(f"📥 Imported {summary}.", "success")
+        return redirect(url_for("admin_dashboard"))
+
+    return render_template("admin/import.html")
+
 # -----------------------
 # DELETE USER (and runs)
 # -----------------------
 @app.route("/admin/user/<int:user_id>/delete", methods=["POST"])
 @admin_required
 def delete_user(user_id):
-    # delete runs first (foreign key constraint)
-    psql("DELETE FROM runs WHERE user_id = %s;", (user_id,), fetch=False)
-    # delete user
+    # runs, stats and avatars go with it (ON DELETE CASCADE), in one atomic statement
     psql("DELETE FROM users WHERE user_id = %s;", (user_id,), fetch=False)
+    site_state.invalidate()
+    page_cache.invalidate("runs", "users", f"user:{user_id}")
     flash(f"🗑️ Deleted user {user_id} and their runs.", "success")
     return redirect(url_for("admin_dashboard"))
 
 
+def set_profile_picture(user_id, blob, mimetype):
+    """
+    Point the user at a newly stored picture. The resized avatars are made by
+    the worker; until then /profile_picture serves the original for every size.
+    """
+    with transaction():
+        psql(
+            "UPDATE users SET profile_picture=NULL, profile_picture_sha256=%s, profile_picture_size=%s, profile_picture_mime=%s, profile_picture_updated_at=NOW() WHERE user_id=%s;",
+            (blob.digest, blob.size, mimetype, user_id),
+            fetch=False
+        )
+        psql("DELETE FROM avatar_variants WHERE user_id = %s;", (user_id,), fetch=False)
+        enqueue("avatar_variants", {"user_id": user_id, "digest": blob.digest})
+
+
 # -----------------------
 # EDIT USER
 # -----------------------
@@ -130,42 +380,40 @@ def edit_user(user_id):
         profile_picture = request.files.get("profile_picture")
         remove_picture = request.form.get("remove_picture")
         
-        if new_username != psql("SELECT username FROM users WHERE user_id = %s;", (user_id,))[0]['username']:
-            if psql("SELECT user_id FROM users WHERE username = %s", (new_username,)) == []:
-            
-                psql(
-                    "UPDATE users SET username=%s, username_lower=LOWER(%s) WHERE user_id=%s;",
-                    (new_username, new_username, user_id),
-                    fetch=False,
-                )
+        # Rename in one statement, the unique index on username_lower catches duplicates
+        try:
+            renamed = psql(
+                "UPDATE users SET username=%s, username_lower=LOWER(%s) WHERE user_id=%s AND username <> %s RETURNING user_id;",
+                (new_username, new_username, user_id, new_username),
+            )
+            if renamed:
+                page_cache.invalidate("users", f"user:{user_id}")
                 flash("✅ Username updated.", "success")
-            else:
-                flash("❌ Username is already taken.", "fail")
+        except errors.UniqueViolation:
+            flash("❌ Username is already taken.", "fail")
 
-        
         # Handle profile picture upload
         if profile_picture and profile_picture.filename:
-            picture_bytes = profile_picture.read()
-            mimetype = mimetypes.guess_type(profile_picture.filename)[0] or "image/jpeg"
-            psql(
-                "UPDATE users SET profile_picture=%s, profile_picture_mime=%s WHERE user_id=%s;",
-                (psycopg2.Binary(picture_bytes), mimetype, user_id),
-                fetch=False
-            )
+            blob, mimetype = ingest_upload(profile_picture, "image")
+            set_profile_picture(user_id, blob, mimetype)
+            page_cache.invalidate(f"user:{user_id}")
             flash("✅ Profile picture updated.", "success")
         
         # Handle profile picture removal
         if remove_picture == "yes":
-            psql(
-                "UPDATE users SET profile_picture=NULL, profile_picture_mime=NULL WHERE user_id=%s;",
-                (user_id,),
-                fetch=False
-            )
+            with transaction():
+                psql(
+                    "UPDATE users SET profile_picture=NULL, profile_picture_sha256=NULL, profile_picture_size=NULL, profile_picture_mime=NULL, profile_picture_updated_at=NOW() WHERE user_id=%s;",
+                    (user_id,),
+                    fetch=False
+                )
+                psql("DELETE FROM avatar_variants WHERE user_id = %s;", (user_id,), fetch=False)
+            page_cache.invalidate(f"user:{user_id}")
             flash("🗑️ Profile picture removed.", "success")
         
         return redirect(url_for("admin_dashboard"))
     
-    user = psql("SELECT * FROM users WHERE user_id = %s;", (user_id,))
+    user = psql("SELECT user_id, username, profile_picture_sha256 FROM users WHERE user_id = %s;", (user_id,))
     return render_template("admin/edit_user.html", user=user[0])
 
 
@@ -175,7 +423,9 @@ def edit_user(user_id):
 @app.route("/admin/run/<int:run_id>/delete", methods=["POST"])
 @admin_required
 def delete_run(run_id):
-    psql("DELETE FROM runs WHERE run_id = %s;", (run_id,), fetch=False)
+    deleted = psql("DELETE FROM runs WHERE run_id = %s RETURNING user_id;", (run_id,))
+    site_state.invalidate()
+    page_cache.invalidate("runs", *(f"user:{row['user_id']}" for row in deleted))
     flash(f"🗑️ Deleted run {run_id}.", "success")
     return redirect(url_for("admin_dashboard"))
 
@@ -193,96 +443,258 @@ def edit_run(run_id):
         time_s = request.form.get("time_seconds")
         video_file = request.files.get("video")
         
-        # Get current run info
-        current_run = psql("SELECT description, time_seconds, user_id FROM runs WHERE run_id = %s;", (run_id,))[0]
-        
-        # Check if user exists (case-insensitive)
-        user = psql("SELECT user_id FROM users WHERE username_lower = LOWER(%s);", (username,))
-        
-        if not user:
-            # Create new user if doesn't exist
-            psql("INSERT INTO users (username, username_lower) VALUES (%s, LOWER(%s));", (username, username))
-            user = psql("SELECT user_id FROM users WHERE username_lower = LOWER(%s);", (username,))
-            flash(f"✨ Created new user: {username}", "info")
-        
-        user_id = user[0]['user_id']
-        
-        # Update the run
-        cur_desc, cur_time = current_run['description'], current_run['time_seconds']
-        if (desc, time_s) != (cur_desc, cur_time) or user_id != current_run['user_id']:
-            psql(
-                "UPDATE runs SET user_id=%s, description=%s, time_seconds=%s WHERE run_id=%s;",
-                (user_id, desc, time_s, run_id),
-                fetch=False,
-            )
-            flash("✅ Run updated.", "success")
-        
-        # Update video if provided
+        blob = None
         if video_file and video_file.filename:
-            video_bytes = video_file.read()
-            mimetype = mimetypes.guess_type(video_file.filename)[0] or "application/octet-stream"
-            psql(
-                "UPDATE runs SET video_data=%s, video_mime=%s WHERE run_id=%s;",
-                (psycopg2.Binary(video_bytes), mimetype, run_id),
-                fetch=False
-            )
-            flash("🎥 Video updated.", "success")
+            blob, mimetype = ingest_upload(video_file, "video")
+
+        changed_tags = set()
+        with transaction() as tx:
+            # Get or create the user (case-insensitive)
+            user = upsert_user(tx, username)
+            if user['created']:
+                flash(f"✨ Created new user: {username}", "info")
+
+            # Update the run, only if something actually changed
+            updated = tx.execute("""
+                UPDATE runs r SET user_id=%s, description=%s, time_seconds=%s
+                FROM runs old
+                WHERE r.run_id=%s AND old.run_id = r.run_id
+                  AND (r.user_id, r.description, r.time_seconds) IS DISTINCT FROM (%s, %s, %s::float)
+                RETURNING old.user_id AS old_user_id;
+            """, (user['user_id'], desc, time_s, run_id, user['user_id'], desc, time_s))
+            if updated:
+                changed_tags |= {"runs", f"user:{user['user_id']}", f"user:{updated[0]['old_user_id']}"}
+                flash("✅ Run updated.", "success")
+
+            # Update video if provided
+            if blob:
+                tx.execute("""
+                    UPDATE runs SET video_data=NULL, video_sha256=%s, video_size=%s, video_mime=%s, video_updated_at=NOW(),
+                                    video_duration=NULL, video_width=NULL, video_height=NULL, processing_status='pending'
+                    WHERE run_id=%s;
+                """, (blob.digest, blob.size, mimetype, run_id), fetch=False)
+                enqueue("process_video", {"run_id": run_id, "digest": blob.digest})
+                flash("🎥 Video updated.", "success")
+        if changed_tags:
+            page_cache.invalidate(*changed_tags)
         
         return redirect(url_for("admin_dashboard"))
     
     run = psql("""
-        SELECT r.*, u.username 
+        SELECT r.run_id, r.user_id, r.description, r.time_seconds, r.run_date,
+               (r.video_sha256 IS NOT NULL OR r.video_data IS NOT NULL) AS has_video,
+               u.username
         FROM runs r 
         JOIN users u ON r.user_id = u.user_id 
         WHERE r.run_id = %s;
     """, (run_id,))
     
-    # Get all usernames for datalist
-    users = psql("SELECT username FROM users ORDER BY username;")
-    
-    return render_template("admin/edit_run.html", run=run[0], users=users)
+    return render_template("admin/edit_run.html", run=run[0])
+
 
+LEADERBOARD_PAGE_SIZE = int(os.getenv("LEADERBOARD_PAGE_SIZE", "50"))
+
+# Sort key -> ORDER BY used for paging. meters, best and recent walk their partial index on
+# user_stats, username walks users.username_lower
+LEADERBOARD_SORTS = {
+    "meters": "runs_count DESC, best_time ASC",
+    "best": "best_time ASC, runs_count DESC",
+    "recent": "last_run DESC",
+    "username": "username_lower ASC",
+}
 
 @app.route("/leaderboard")
+@page_cache.cached("runs", "users")
 def leaderboard():
-    rows = psql("""
-        SELECT u.user_id, u.username, COUNT(r.run_id) AS runs_count, MIN(r.time_seconds) AS best_time
-        FROM users u
-        NATURAL JOIN runs r
-        GROUP BY u.user_id
-        ORDER BY runs_count DESC, best_time ASC;
-    """)
-    return render_template("leaderboard.html", leaderboard=rows)
+    sort = request.args.get("sort", "meters")
+    if sort not in LEADERBOARD_SORTS:
+        sort = "meters"
+    page = max(request.args.get("page", 1, type=int), 1)
+    order = LEADERBOARD_SORTS[sort]
+
+    # Stats are kept up to date by triggers on runs, so this reads user_stats (one row per
+    # user) instead of aggregating runs. Only the page is read in sort order; the rank is
+    # always by meters (RANK() semantics: 1 + users strictly ahead), counted per row on
+    # user_stats_meters_idx, so it costs about as many index entries as the rank is high.
+    rows = psql(f"""
+        SELECT p.*,
+               1 + (SELECT COUNT(*) FROM user_stats o
+                    WHERE o.runs_count > 0 AND o.runs_count > p.runs_count)
+                 + (SELECT COUNT(*) FROM user_stats o
+                    WHERE o.runs_count > 0 AND o.runs_count = p.runs_count AND o.best_time < p.best_time) AS rank
+        FROM (
+            SELECT u.user_id, u.username, u.username_lower, s.runs_count, s.best_time, s.total_time, s.last_run
+            FROM user_stats s
+            JOIN users u ON u.user_id = s.user_id
+            WHERE s.runs_count > 0
+            ORDER BY {order}, s.user_id
+            LIMIT %s OFFSET %s
+        ) p
+        ORDER BY {order}, p.user_id;
+    """, (LEADERBOARD_PAGE_SIZE + 1, (page - 1) * LEADERBOARD_PAGE_SIZE))
+    has_next = len(rows) > LEADERBOARD_PAGE_SIZE
+    return render_template(
+        "leaderboard.html",
+        leaderboard=rows[:LEADERBOARD_PAGE_SIZE],
+        sort=sort,
+        page=page,
+        has_next=has_next,
+    )
+
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+
+def encode_cursor(row):
+    """Seek cursor for the history feed: the (run_date, run_id) of the last row shown"""
+    return f"{row['run_date'].isoformat()}_{row['run_id']}"
+
+def decode_cursor(cursor):
+    try:
+        run_date, run_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(run_date), int(run_id)
+    except (AttributeError, ValueError):
+        return None
+
+def history_page(cursor):
+    """
+    One page of runs, newest first, continuing after `cursor`.
+    Served by an index range scan on runs (run_date DESC, run_id DESC), no sort.
+    Returns (rows, next_cursor).
+    """
+    seek = decode_cursor(cursor)
+    where = "WHERE (r.run_date, r.run_id) < (%s, %s)" if seek else ""
+    rows = psql(f"""
+        SELECT u.user_id, u.username, r.run_id, r.time_seconds, r.run_date
+        FROM runs r
+        JOIN users u ON u.user_id = r.user_id
+        {where}
+        ORDER BY r.run_date DESC, r.run_id DESC
+        LIMIT %s;
+    """, (seek or ()) + (HISTORY_PAGE_SIZE + 1,))
+    next_cursor = encode_cursor(rows[HISTORY_PAGE_SIZE - 1]) if len(rows) > HISTORY_PAGE_SIZE else None
+    return rows[:HISTORY_PAGE_SIZE], next_cursor
 
 @app.route("/history")
+@page_cache.cached("runs", "users")
 def history():
+    rows, next_cursor = history_page(request.args.get("cursor"))
+    return render_template("history.html", runs=rows, next_cursor=next_cursor)
+
+@app.route("/history.json")
+def history_json():
+    rows, next_cursor = history_page(request.args.get("cursor"))
+    return jsonify({
+        "runs": [
+            {
+                "user_id": row["user_id"],
+                "username": row["username"],
+                "run_id": row["run_id"],
+                "time_seconds": row["time_seconds"],
+                "run_date": row["run_date"].isoformat(),
+                "profile_url": url_for("profile", user_id=row["user_id"]),
+                "meter_url": url_for("meter", run_id=row["run_id"]),
+            }
+            for row in rows
+        ],
+        "next_cursor": next_cursor,
+    })
+
+PROFILE_PAGE_SIZE = int(os.getenv("PROFILE_PAGE_SIZE", "50"))
+# Seconds a worker reuses a user's stats. A write drops them in the worker that
+# handled it; other workers show the old numbers for up to this long.
+PROFILE_STATS_TTL = float(os.getenv("PROFILE_STATS_TTL", "60"))
+# Most points in the personal-best series of stats.json
+PB_SERIES_POINTS = 100
+
+@page_cache.memoize("user:{user_id}", ttl=PROFILE_STATS_TTL)
+def user_summary(user_id):
+    """
+    Count, best, average and rank from user_stats (kept by triggers), so the
+    cost doesn't depend on how many runs the user has. Three COUNT(*)
+    subqueries over runners with runs give the rest: slower and faster bests
+    (range scans of user_stats_best_idx) and everyone (a full pass over it),
+    so this grows with the number of runners and is memoized. percentile is
+    the share of other runners with a slower best.
+    """
     rows = psql("""
-        SELECT u.user_id, u.username, r.run_id, r.time_seconds, r.run_date
-        FROM runs r
-        NATURAL JOIN users u
-        ORDER BY r.run_date DESC;
-    """)
-    return render_template("history.html", runs=rows)
+        SELECT s.runs_count, s.best_time, s.total_time / s.runs_count AS avg_time,
+               (SELECT COUNT(*) FROM user_stats o WHERE o.runs_count > 0 AND o.best_time > s.best_time) AS slower,
+               (SELECT COUNT(*) FROM user_stats o WHERE o.runs_count > 0 AND o.best_time < s.best_time) + 1 AS rank,
+               (SELECT COUNT(*) FROM user_stats o WHERE o.runs_count > 0) AS ranked
+        FROM user_stats s
+        WHERE s.user_id = %s AND s.runs_count > 0;
+    """, (user_id,))
+    if not rows:
+        return {"runs_count": 0, "best": None, "avg": None, "rank": None, "ranked": None, "percentile": None}
+    row = rows[0]
+    return {
+        "runs_count": row["runs_count"],
+        "best": row["best_time"],
+        "avg": row["avg_time"],
+        "rank": row["rank"],
+        "ranked": row["ranked"],
+        "percentile": round(100 * row["slower"] / (row["ranked"] - 1), 1) if row["ranked"] > 1 else 100.0,
+    }
+
+@page_cache.memoize("user:{user_id}", ttl=PROFILE_STATS_TTL)
+def pb_progression(user_id):
+    """
+    The runs that set a new personal best, oldest first. Longer series are
+    thinned to PB_SERIES_POINTS buckets, keeping the best run of each.
+    """
+    rows = psql("""
+        WITH pbs AS (
+            SELECT run_id, run_date, time_seconds
+            FROM (
+                SELECT run_id, run_date, time_seconds,
+                       MIN(time_seconds) OVER (ORDER BY run_date, run_id
+                                               ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS previous_best
+                FROM runs
+                WHERE user_id = %s
+            ) r
+            WHERE previous_best IS NULL OR time_seconds < previous_best
+        )
+        SELECT DISTINCT ON (bucket) run_id, run_date, time_seconds
+        FROM (SELECT *, ntile(%s) OVER (ORDER BY run_date, run_id) AS bucket FROM pbs) b
+        ORDER BY bucket, time_seconds;
+    """, (user_id, PB_SERIES_POINTS))
+    return [
+        {"run_id": row["run_id"], "run_date": row["run_date"].isoformat(), "time_seconds": row["time_seconds"]}
+        for row in rows
+    ]
+
+def profile_runs_page(user_id, cursor):
+    """One page of the user's runs, newest first, on runs_user_id_run_date_idx. Returns (rows, next_cursor)."""
+    seek = decode_cursor(cursor)
+    where = "AND (run_date, run_id) < (%s, %s)" if seek else ""
+    rows = psql(f"""
+        SELECT run_id, time_seconds, run_date
+        FROM runs
+        WHERE user_id = %s {where}
+        ORDER BY run_date DESC, run_id DESC
+        LIMIT %s;
+    """, (user_id,) + (seek or ()) + (PROFILE_PAGE_SIZE + 1,))
+    next_cursor = encode_cursor(rows[PROFILE_PAGE_SIZE - 1]) if len(rows) > PROFILE_PAGE_SIZE else None
+    return rows[:PROFILE_PAGE_SIZE], next_cursor
 
 @app.route("/profile/<int:user_id>")
+@page_cache.cached("user:{user_id}")
 def profile(user_id):
-    user = psql("SELECT user_id, username FROM users WHERE user_id = %s;", (user_id,))[0]
-    runs = psql("""
-        SELECT run_id, time_seconds, run_date
-        FROM runs
-        WHERE user_id = %s
-        ORDER BY run_date DESC;
-    """, (user_id,))
-    best = min((run['time_seconds'] for run in runs), default=None)
-    avg = (sum(run['time_seconds'] for run in runs) / len(runs)) if runs else None
-    return render_template("profile.html", user=user, runs=runs, best=best, avg=avg)
+    user = psql("SELECT user_id, username, profile_picture_sha256 FROM users WHERE user_id = %s;", (user_id,))[0]
+    runs, next_cursor = profile_runs_page(user_id, request.args.get("cursor"))
+    return render_template("profile.html", user=user, runs=runs, next_cursor=next_cursor, stats=user_summary(user_id))
+
+@app.route("/profile/<int:user_id>/stats.json")
+def profile_stats(user_id):
+    response = jsonify({"user_id": user_id, **user_summary(user_id), "pb_progression": pb_progression(user_id)})
+    response.headers["Cache-Control"] = "public, max-age=60"
+    return response
 
 # -----------------------
 # EDIT PROFILE (for users to upload their own picture)
 # -----------------------
 @app.route("/profile/<int:user_id>/edit", methods=["GET", "POST"])
 def edit_profile(user_id):
-    user = psql("SELECT user_id, username FROM users WHERE user_id = %s;", (user_id,))
+    user = psql("SELECT user_id, username, profile_picture_sha256 FROM users WHERE user_id = %s;", (user_id,))
     if not user:
         return "User not found", 404
     
@@ -290,15 +702,11 @@ def edit_profile(user_id):
         picture = request.files.get("profile_picture")
         
         if picture and picture.filename:
-            # Read and store the picture
-            picture_bytes = picture.read()
-            mimetype = mimetypes.guess_type(picture.filename)[0] or "image/jpeg"
+            # Store the picture in the blob store, the DB only keeps its digest
+            blob, mimetype = ingest_upload(picture, "image")
             
-            psql(
-                "UPDATE users SET profile_picture=%s, profile_picture_mime=%s WHERE user_id=%s;",
-                (psycopg2.Binary(picture_bytes), mimetype, user_id),
-                fetch=False
-            )
+            set_profile_picture(user_id, blob, mimetype)
+            page_cache.invalidate(f"user:{user_id}")
             flash("✅ Profile picture updated!", "success")
         else:
             flash("⚠️ No picture selected", "warning")
@@ -312,8 +720,44 @@ def edit_profile(user_id):
 # -----------------------
 @app.route("/profile_picture/<int:user_id>")
 def profile_picture(user_id):
-    query = "SELECT profile_picture, profile_picture_mime FROM users WHERE user_id = %s;"
+    size = request.args.get("size", type=int)
+    if size:
+        # Resized variant, WebP for browsers that list it explicitly (not just */*)
+        fmt = "webp" if "image/webp" in request.headers.get("Accept", "") else "jpeg"
+        rows = psql("""
+            SELECT v.sha256, v.mime, u.profile_picture_sha256, u.profile_picture_updated_at
+            FROM avatar_variants v
+            JOIN users u ON u.user_id = v.user_id
+            WHERE v.user_id = %s AND v.size = %s AND v.format = %s;
+        """, (user_id, pick_avatar_size(size), fmt))
+        if rows:
+            digest, updated_at = rows[0]["sha256"], rows[0]["profile_picture_updated_at"]
+            original = rows[0]["profile_picture_sha256"]
+            cached = not_modified(digest, updated_at, original)
+            if not cached:
+                cached = send_file(get_blob_store().path(digest), mimetype=rows[0]["mime"], etag=False)
+                set_cache_headers(cached, digest, updated_at, original)
+            cached.vary.add("Accept")
+            return cached
+
+    query = "SELECT profile_picture_sha256, profile_picture_mime, profile_picture_updated_at FROM users WHERE user_id = %s;"
     rows = psql(query, (user_id,))
+    if rows and rows[0]["profile_picture_sha256"]:
+        digest, updated_at = rows[0]["profile_picture_sha256"], rows[0]["profile_picture_updated_at"]
+        # Standing in for a resized avatar the worker hasn't made yet: don't let it be cached for good
+        immutable = not size
+        cached = not_modified(digest, updated_at, immutable=immutable)
+        if cached:
+            return cached
+        response = send_file(
+            get_blob_store().path(digest),
+            mimetype=rows[0]["profile_picture_mime"] or "image/jpeg",
+            as_attachment=False,
+            etag=False,
+        )
+        return set_cache_headers(response, digest, updated_at, immutable=immutable)
+    # Pictures not yet moved out of the database by migrate_blobs.py
+    rows = psql("SELECT profile_picture, profile_picture_mime FROM users WHERE user_id = %s;", (user_id,))
     if rows and rows[0]["profile_picture"]:
         return send_file(
             io.BytesIO(rows[0]["profile_picture"]),
@@ -326,7 +770,8 @@ def profile_picture(user_id):
 @app.route("/meter/<int:run_id>")
 def meter(run_id):
     row = psql("""
-        SELECT r.run_id, r.time_seconds, r.run_date, u.username
+        SELECT r.run_id, r.time_seconds, r.run_date, r.video_sha256, r.video_duration,
+               r.video_width, r.video_height, u.username
         FROM runs r
         NATURAL JOIN users u
         WHERE r.run_id = %s;
@@ -337,6 +782,45 @@ def meter(run_id):
     return render_template("meter.html", run=run)
 
 
+USER_SEARCH_LIMIT = 10
+
+@app.route("/api/users/search")
+def search_users():
+    """Username suggestions for the upload and edit run forms: ?q=<prefix>[&limit=]"""
+    q = request.args.get("q", "").strip().lower()
+    limit = min(max(request.args.get("limit", USER_SEARCH_LIMIT, type=int), 1), 50)
+    rows = []
+    if q:
+        # Range scan on users_username_lower_pattern_idx; ~<~ is the order of that
+        # index, in which an exact match always comes first
+        rows = psql("""
+            SELECT user_id, username, username_lower
+            FROM users
+            WHERE username_lower LIKE %s
+            ORDER BY username_lower USING ~<~
+            LIMIT %s;
+        """, (like_prefix(q), limit))
+    response = jsonify({
+        "users": [{"user_id": row["user_id"], "username": row["username"]} for row in rows],
+        "exact": bool(rows) and rows[0]["username_lower"] == q,
+    })
+    response.cache_control.public = True
+    response.cache_control.max_age = 10
+    return response
+
+
+def upsert_user(tx, username, picture=None, picture_mime=None):
+    """
+    Get or create a user by name (case-insensitive) in one statement.
+    The picture is only stored if the user is new. Returns a row with user_id and created.
+    """
+    return tx.execute("""
+        INSERT INTO users (username, username_lower, profile_picture_sha256, profile_picture_size, profile_picture_mime)
+        VALUES (%s, LOWER(%s), %s, %s, %s)
+        ON CONFLICT (username_lower) DO UPDATE SET username_lower = EXCLUDED.username_lower
+        RETURNING user_id, (xmax = 0) AS created;
+    """, (username, username, picture.digest if picture else None, picture.size if picture else None, picture_mime))[0]
+
 @app.route("/upload", methods=["GET", "POST"])
 def upload():
     if request.method == "POST":
@@ -349,54 +833,67 @@ def upload():
         if not username or not file or not time_seconds:
             return "Missing fields", 400
 
-        # Check if user exists (case-insensitive)
-        user = psql("SELECT user_id FROM users WHERE username_lower = LOWER(%s);", (username,))
-        
-        if not user:
-            # Create new user
-            picture_bytes = None
-            picture_mime = None
-            
-            # If profile picture provided for new user, save it
-            if profile_picture and profile_picture.filename:
-                picture_bytes = profile_picture.read()
-                picture_mime = mimetypes.guess_type(profile_picture.filename)[0] or "image/jpeg"
-            
-            psql(
-                "INSERT INTO users (username, username_lower, profile_picture, profile_picture_mime) VALUES (%s, LOWER(%s), %s, %s);",
-                (username, username, psycopg2.Binary(picture_bytes) if picture_bytes else None, picture_mime)
-            )
-            user = psql("SELECT user_id FROM users WHERE username_lower = LOWER(%s);", (username,))
-
-        user_id = user[0]['user_id']
-
-        # Save the video with MIME type
-        video_bytes = file.read()
-        mimetype = mimetypes.guess_type(file.filename)[0] or "application/octet-stream"
+        # Save the video in the blob store, the run only keeps its digest and MIME type
+        # Only the raw bytes are stored here, the worker post-processes them (faststart, metadata)
+        blob, mimetype = ingest_upload(file, "video")
 
-        psql(
-            "INSERT INTO runs (user_id, description, time_seconds, video_data, video_mime) VALUES (%s, %s, %s, %s, %s);",
-            (user_id, description, time_seconds, psycopg2.Binary(video_bytes), mimetype),
-            fetch=False
-        )
+        # Profile picture is only used if this creates a new user
+        picture, picture_mime = None, None
+        if profile_picture and profile_picture.filename:
+            picture, picture_mime = ingest_upload(profile_picture, "image")
+
+        with transaction() as tx:
+            # Get or create the user (case-insensitive)
+            user = upsert_user(tx, username, picture, picture_mime)
+            if user['created'] and picture:
+                enqueue("avatar_variants", {"user_id": user['user_id'], "digest": picture.digest})
+
+            run = tx.execute("""
+                INSERT INTO runs (user_id, description, time_seconds, video_sha256, video_size, video_mime, processing_status)
+                VALUES (%s, %s, %s, %s, %s, %s, 'pending')
+                RETURNING run_id;
+            """, (user['user_id'], description, time_seconds, blob.digest, blob.size, mimetype))[0]
+            # Queued in the same transaction: no job without its run, no run without its job
+            enqueue("process_video", {"run_id": run['run_id'], "digest": blob.digest})
+        site_state.invalidate()
+        page_cache.invalidate("runs", f"user:{user['user_id']}")
 
         return redirect(url_for("index"))
 
-    users = psql("SELECT username FROM users ORDER BY username;")
-    return render_template("upload.html", users=users)
+    return render_template("upload.html")
 
 
 
 @app.route("/video/<int:run_id>")
 def video(run_id):
-    query = "SELECT video_data, video_mime FROM runs WHERE run_id = %s;"
+    query = "SELECT video_sha256, video_mime, video_updated_at FROM runs WHERE run_id = %s;"
     rows = psql(query, (run_id,))
-    if rows and rows[0]["video_data"]:
-        return send_file(
-            io.BytesIO(rows[0]["video_data"]),
+    if rows and rows[0]["video_sha256"]:
+        digest, updated_at = rows[0]["video_sha256"], rows[0]["video_updated_at"]
+        cached = not_modified(digest, updated_at)
+        if cached:
+            return cached
+        # send_file on a real path handles Range itself and lets the server use sendfile
+        response = send_file(
+            get_blob_store().path(digest),
             mimetype=rows[0]["video_mime"] or "application/octet-stream",
             as_attachment=False,
-            download_name=f"run_{run_id}"
+            download_name=f"run_{run_id}",
+            conditional=True,
+            etag=digest,
+            last_modified=updated_at,
+        )
+        return set_cache_headers(response, digest, updated_at)
+
+    # Videos not yet moved out of the database by migrate_blobs.py:
+    # only fetch the size here, the bytes are streamed in chunks (and by Range)
+    query = "SELECT octet_length(video_data) AS video_size, video_mime FROM runs WHERE run_id = %s;"
+    rows = psql(query, (run_id,))
+    if rows and rows[0]["video_size"]:
+        return stream_video(
+            run_id,
+            rows[0]["video_size"],
+            rows[0]["video_mime"] or "application/octet-stream",
         )
     return "Video not found", 404
 
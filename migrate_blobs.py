@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Move videos and profile pictures out of the BYTEA columns into the blob store
+
+Each row is copied, hashed and committed on its own, so the migration can be
+stopped at any time and simply re-run to continue where it left off.
+
+Run: python3 migrate_blobs.py [--batch-size 50] [--avatars] [--gc]
+"""
+import argparse
+import time
+
+from utils.psql import psql, psql_iter
+from utils.blobstore import get_blob_store
+from utils.media import iter_video_chunks
+from utils.images import save_avatar_variants
+
+# Unreferenced blobs and temp files younger than this are kept, they may belong to an upload in flight
+GC_GRACE_SECONDS = 3600
+
+
+def migrate_videos(store, batch_size):
+    moved = 0
+    while True:
+        rows = psql("""
+            SELECT run_id, octet_length(video_data) AS video_size
+            FROM runs
+            WHERE video_data IS NOT NULL AND video_sha256 IS NULL
+            ORDER BY run_id
+            LIMIT %s;
+        """, (batch_size,))
+        if not rows:
+            return moved
+        for row in rows:
+            blob = store.put_chunks(iter_video_chunks(row["run_id"], 0, row["video_size"]))
+            psql(
+                "UPDATE runs SET video_sha256=%s, video_size=%s, video_data=NULL WHERE run_id=%s AND video_sha256 IS NULL;",
+                (blob.digest, blob.size, row["run_id"]),
+                fetch=False,
+            )
+            moved += 1
+            print(f"run {row['run_id']}: {blob.size} bytes -> {blob.digest}")
+
+
+def migrate_pictures(store, batch_size):
+    moved = 0
+    while True:
+        rows = psql("""
+            SELECT user_id
+            FROM users
+            WHERE profile_picture IS NOT NULL AND profile_picture_sha256 IS NULL
+            ORDER BY user_id
+            LIMIT %s;
+        """, (batch_size,))
+        if not rows:
+            return moved
+        for row in rows:
+            # Pictures are small, so one at a time is fine
+            picture = psql("SELECT profile_picture FROM users WHERE user_id = %s;", (row["user_id"],))[0]
+            blob = store.put_chunks([bytes(picture["profile_picture"])])
+            psql(
+                "UPDATE users SET profile_picture_sha256=%s, profile_picture_size=%s, profile_picture=NULL WHERE user_id=%s AND profile_picture_sha256 IS NULL;",
+                (blob.digest, blob.size, row["user_id"]),
+                fetch=False,
+            )
+            moved += 1
+            print(f"user {row['user_id']}: {blob.size} bytes -> {blob.digest}")
+
+
+def generate_avatars(batch_size):
+    """Create the resized avatars for pictures stored before avatar_variants existed"""
+    done = 0
+    last_id = 0
+    while True:
+        rows = psql("""
+            SELECT u.user_id, u.profile_picture_sha256
+            FROM users u
+            WHERE u.profile_picture_sha256 IS NOT NULL AND u.user_id > %s
+              AND NOT EXISTS (SELECT 1 FROM avatar_variants v WHERE v.user_id = u.user_id)
+            ORDER BY u.user_id
+            LIMIT %s;
+        """, (last_id, batch_size))
+        if not rows:
+            return done
+        for row in rows:
+            save_avatar_variants(row["user_id"], row["profile_picture_sha256"])
+            last_id = row["user_id"]
+            done += 1
+
+
+def collect_garbage(store):
+    """
+    Delete blobs no row points at any more (replaced or removed media) and
+    leftover temp files of failed uploads. Returns (blobs, temp files) removed.
+    """
+    referenced = {
+        row[0] for row in psql_iter("""
+            SELECT video_sha256 FROM runs WHERE video_sha256 IS NOT NULL
+            UNION
+            SELECT profile_picture_sha256 FROM users WHERE profile_picture_sha256 IS NOT NULL
+            UNION
+            SELECT sha256 FROM avatar_variants;
+        """, row_type="tuple")
+    }
+    cutoff = time.time() - GC_GRACE_SECONDS
+    removed = 0
+    for digest, mtime in store.iter_digests():
+        if digest not in referenced and mtime < cutoff:
+            store.delete(digest)
+            removed += 1
+    return removed, store.purge_temp(cutoff)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--avatars", action="store_true", help="also generate missing avatar sizes")
+    parser.add_argument("--gc", action="store_true", help="also delete unreferenced blobs")
+    args = parser.parse_args()
+
+    store = get_blob_store()
+    videos = migrate_videos(store, args.batch_size)
+    pictures = migrate_pictures(store, args.batch_size)
+    print(f"Done. Moved {videos} videos and {pictures} profile pictures.")
+
+    if args.avatars:
+        print(f"Generated avatars for {generate_avatars(args.batch_size)} users.")
+
+    if args.gc:
+        blobs, temp_files = collect_garbage(store)
+        print(f"Removed {blobs} unreferenced blobs and {temp_files} stale temp files.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+-- Move media out of BYTEA into the blob store (utils/blobstore.py).
+-- Run once on an existing database, then run migrate_blobs.py.
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS profile_picture_sha256 CHAR(64);
+ALTER TABLE users ADD COLUMN IF NOT EXISTS profile_picture_size BIGINT;
+
+ALTER TABLE runs ADD COLUMN IF NOT EXISTS video_sha256 CHAR(64);
+ALTER TABLE runs ADD COLUMN IF NOT EXISTS video_size BIGINT;
+
+ALTER TABLE runs ALTER COLUMN video_data SET STORAGE EXTERNAL;
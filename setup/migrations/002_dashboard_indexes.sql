@@ -0,0 +1,2 @@
+-- Admin dashboard: runs of one user, paged by run_id
+CREATE INDEX IF NOT EXISTS runs_user_id_run_id_idx ON runs (user_id, run_id);
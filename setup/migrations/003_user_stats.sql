@@ -0,0 +1,78 @@
+-- Per-user run statistics for the leaderboard, kept up to date by triggers on runs
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INT PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    runs_count INT NOT NULL DEFAULT 0,
+    best_time FLOAT,
+    total_time FLOAT NOT NULL DEFAULT 0,
+    last_run TIMESTAMP
+);
+
+-- Leaderboard pages walk these in sort order (by name it walks users.username_lower);
+-- meters also counts leaderboard ranks, best the profile percentiles
+CREATE INDEX IF NOT EXISTS user_stats_meters_idx ON user_stats (runs_count DESC, best_time ASC, user_id) WHERE runs_count > 0;
+CREATE INDEX IF NOT EXISTS user_stats_best_idx ON user_stats (best_time ASC, runs_count DESC, user_id) WHERE runs_count > 0;
+CREATE INDEX IF NOT EXISTS user_stats_recent_idx ON user_stats (last_run DESC, user_id) WHERE runs_count > 0;
+
+-- Recompute one user's stats from their runs (after an update or delete)
+CREATE OR REPLACE FUNCTION refresh_user_stats(uid INT) RETURNS void AS $$
+    UPDATE user_stats s
+    SET runs_count = a.runs_count,
+        best_time = a.best_time,
+        total_time = a.total_time,
+        last_run = a.last_run
+    FROM (
+        SELECT COUNT(*) AS runs_count, MIN(time_seconds) AS best_time,
+               COALESCE(SUM(time_seconds), 0) AS total_time, MAX(run_date) AS last_run
+        FROM runs
+        WHERE user_id = uid
+    ) a
+    WHERE s.user_id = uid;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION runs_update_user_stats() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        -- Inserts are the hot path, so fold the new run in without rescanning
+        INSERT INTO user_stats (user_id, runs_count, best_time, total_time, last_run)
+        VALUES (NEW.user_id, 1, NEW.time_seconds, NEW.time_seconds, NEW.run_date)
+        ON CONFLICT (user_id) DO UPDATE SET
+            runs_count = user_stats.runs_count + 1,
+            best_time = LEAST(user_stats.best_time, EXCLUDED.best_time),
+            total_time = user_stats.total_time + EXCLUDED.total_time,
+            last_run = GREATEST(user_stats.last_run, EXCLUDED.last_run);
+        RETURN NEW;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO user_stats (user_id) VALUES (NEW.user_id) ON CONFLICT DO NOTHING;
+        PERFORM refresh_user_stats(NEW.user_id);
+        IF NEW.user_id <> OLD.user_id THEN
+            PERFORM refresh_user_stats(OLD.user_id);
+        END IF;
+        RETURN NEW;
+    ELSE
+        PERFORM refresh_user_stats(OLD.user_id);
+        RETURN OLD;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS runs_user_stats_insert ON runs;
+DROP TRIGGER IF EXISTS runs_user_stats_update ON runs;
+DROP TRIGGER IF EXISTS runs_user_stats_delete ON runs;
+
+CREATE TRIGGER runs_user_stats_insert AFTER INSERT ON runs
+    FOR EACH ROW EXECUTE FUNCTION runs_update_user_stats();
+CREATE TRIGGER runs_user_stats_update AFTER UPDATE OF user_id, time_seconds, run_date ON runs
+    FOR EACH ROW EXECUTE FUNCTION runs_update_user_stats();
+CREATE TRIGGER runs_user_stats_delete AFTER DELETE ON runs
+    FOR EACH ROW EXECUTE FUNCTION runs_update_user_stats();
+
+-- Backfill from the existing runs
+INSERT INTO user_stats (user_id, runs_count, best_time, total_time, last_run)
+SELECT user_id, COUNT(*), MIN(time_seconds), SUM(time_seconds), MAX(run_date)
+FROM runs
+GROUP BY user_id
+ON CONFLICT (user_id) DO UPDATE SET
+    runs_count = EXCLUDED.runs_count,
+    best_time = EXCLUDED.best_time,
+    total_time = EXCLUDED.total_time,
+    last_run = EXCLUDED.last_run;
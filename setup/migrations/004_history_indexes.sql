@@ -0,0 +1,7 @@
+-- History feed pages by (run_date, run_id) seek cursors, which needs run_date set everywhere
+UPDATE runs SET run_date = TIMESTAMP '1970-01-01' WHERE run_date IS NULL;
+ALTER TABLE runs ALTER COLUMN run_date SET NOT NULL;
+
+-- History feed and profile history: (run_date, run_id) seek cursors, newest first
+CREATE INDEX IF NOT EXISTS runs_run_date_run_id_idx ON runs (run_date DESC, run_id DESC);
+CREATE INDEX IF NOT EXISTS runs_user_id_run_date_idx ON runs (user_id, run_date DESC, run_id DESC);
@@ -0,0 +1,26 @@
+-- Single-row counters read by the index page instead of COUNT(*) on runs.
+-- config_version is bumped whenever config.json is saved, so workers know to re-read it.
+CREATE TABLE IF NOT EXISTS site_state (
+    id INT PRIMARY KEY CHECK (id = 1),
+    runs_total BIGINT NOT NULL DEFAULT 0,
+    config_version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION runs_update_site_state() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE site_state SET runs_total = runs_total + 1 WHERE id = 1;
+    ELSE
+        UPDATE site_state SET runs_total = runs_total - 1 WHERE id = 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS runs_site_state ON runs;
+CREATE TRIGGER runs_site_state AFTER INSERT OR DELETE ON runs
+    FOR EACH ROW EXECUTE FUNCTION runs_update_site_state();
+
+INSERT INTO site_state (id, runs_total)
+SELECT 1, COUNT(*) FROM runs
+ON CONFLICT (id) DO UPDATE SET runs_total = EXCLUDED.runs_total;
@@ -0,0 +1,5 @@
+-- Last-Modified timestamps for conditional GETs on /video and /profile_picture
+ALTER TABLE users ADD COLUMN IF NOT EXISTS profile_picture_updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE runs ADD COLUMN IF NOT EXISTS video_updated_at TIMESTAMPTZ DEFAULT NOW();
+
+UPDATE runs SET video_updated_at = run_date WHERE video_updated_at IS NULL OR video_updated_at > run_date;
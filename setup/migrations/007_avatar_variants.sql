@@ -0,0 +1,12 @@
+-- Resized profile pictures (see utils/images.py), stored in the blob store next to the original
+CREATE TABLE IF NOT EXISTS avatar_variants (
+    user_id INT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    size INT NOT NULL,
+    format VARCHAR(10) NOT NULL,
+    sha256 CHAR(64) NOT NULL,
+    bytes INT NOT NULL,
+    mime VARCHAR(50) NOT NULL,
+    PRIMARY KEY (user_id, size, format)
+);
+
+-- Existing pictures get their variants from: python3 migrate_blobs.py --avatars
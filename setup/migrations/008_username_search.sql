@@ -0,0 +1,3 @@
+-- Username autocomplete (/api/users/search) and the dashboard user filter: prefix LIKE
+-- on username_lower, which the plain unique index can't serve outside the C locale
+CREATE INDEX IF NOT EXISTS users_username_lower_pattern_idx ON users (username_lower text_pattern_ops);
@@ -0,0 +1,4 @@
+-- Read from the MP4 header at upload (utils/mp4.py), NULL for other formats and older runs
+ALTER TABLE runs ADD COLUMN IF NOT EXISTS video_duration FLOAT;
+ALTER TABLE runs ADD COLUMN IF NOT EXISTS video_width INT;
+ALTER TABLE runs ADD COLUMN IF NOT EXISTS video_height INT;
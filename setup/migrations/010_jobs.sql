@@ -0,0 +1,18 @@
+-- Background jobs (utils/jobs.py, run by worker.py)
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(10) NOT NULL DEFAULT 'queued',  -- queued, running, done, dead
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),  -- next try, or end of the lease while running
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
+-- Claiming: due jobs in order, finished ones stay out of the index
+CREATE INDEX IF NOT EXISTS jobs_due_idx ON jobs (run_after, job_id) WHERE status IN ('queued', 'running');
+
+-- Upload post-processing state shown on the admin dashboard: pending, processing, ready, failed
+ALTER TABLE runs ADD COLUMN IF NOT EXISTS processing_status VARCHAR(12) NOT NULL DEFAULT 'ready';
@@ -0,0 +1,39 @@
+-- Live updates (/events, see utils/events.py): one NOTIFY per statement on runs,
+-- carrying the new total and up to 10 of the inserted runs. Statement-level
+-- triggers run after the row-level runs_site_state trigger, so runs_total is current,
+-- and a bulk import sends one notification instead of one per row.
+CREATE OR REPLACE FUNCTION runs_notify_inserted() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('usainbolt_events', json_build_object(
+        'type', 'runs',
+        'total_runs', (SELECT runs_total FROM site_state WHERE id = 1),
+        'new_runs', (
+            SELECT COALESCE(json_agg(r), '[]') FROM (
+                SELECT n.run_id, n.user_id, u.username, n.time_seconds, n.run_date
+                FROM new_runs n JOIN users u ON u.user_id = n.user_id
+                ORDER BY n.run_date DESC, n.run_id DESC
+                LIMIT 10
+            ) r
+        )
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION runs_notify_deleted() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('usainbolt_events', json_build_object(
+        'type', 'runs',
+        'total_runs', (SELECT runs_total FROM site_state WHERE id = 1)
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS runs_notify_insert ON runs;
+CREATE TRIGGER runs_notify_insert AFTER INSERT ON runs
+    REFERENCING NEW TABLE AS new_runs
+    FOR EACH STATEMENT EXECUTE FUNCTION runs_notify_inserted();
+DROP TRIGGER IF EXISTS runs_notify_delete ON runs;
+CREATE TRIGGER runs_notify_delete AFTER DELETE ON runs
+    FOR EACH STATEMENT EXECUTE FUNCTION runs_notify_deleted();
@@ -1,3 +1,7 @@
+DROP TABLE IF EXISTS jobs;
+DROP TABLE IF EXISTS avatar_variants;
+DROP TABLE IF EXISTS site_state;
+DROP TABLE IF EXISTS user_stats;
 DROP TABLE IF EXISTS runs;
 DROP TABLE IF EXISTS users;
 
@@ -7,8 +11,11 @@ CREATE TABLE users (
     user_id SERIAL PRIMARY KEY,
     username_lower VARCHAR(255) NOT NULL UNIQUE,
     username VARCHAR(255) NOT NULL,
-    profile_picture BYTEA,
-    profile_picture_mime VARCHAR(50)
+    profile_picture BYTEA,  -- legacy, emptied by migrate_blobs.py
+    profile_picture_sha256 CHAR(64),  -- key into the blob store
+    profile_picture_size BIGINT,
+    profile_picture_mime VARCHAR(50),
+    profile_picture_updated_at TIMESTAMPTZ DEFAULT NOW()  -- Last-Modified for /profile_picture
 );
 
 CREATE TABLE runs (
@@ -16,13 +23,181 @@ CREATE TABLE runs (
     user_id INT NOT NULL,
     description TEXT,
     time_seconds FLOAT NOT NULL,
-    run_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    video_data BYTEA,
+    run_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    video_data BYTEA,  -- legacy, emptied by migrate_blobs.py
+    video_sha256 CHAR(64),  -- key into the blob store
+    video_size BIGINT,
     video_mime VARCHAR(50),
+    video_updated_at TIMESTAMPTZ DEFAULT NOW(),  -- Last-Modified for /video
+    video_duration FLOAT,  -- seconds, from the MP4 header (utils/mp4.py)
+    video_width INT,
+    video_height INT,
+    processing_status VARCHAR(12) NOT NULL DEFAULT 'ready',  -- upload post-processing: pending, processing, ready, failed
     FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
 );
 
+-- Username autocomplete and the dashboard user filter: prefix LIKE on username_lower
+CREATE INDEX users_username_lower_pattern_idx ON users (username_lower text_pattern_ops);
 
+-- Store videos uncompressed out-of-line so substring() only reads the requested slice
+ALTER TABLE runs ALTER COLUMN video_data SET STORAGE EXTERNAL;
 
+-- Admin dashboard: runs of one user, paged by run_id
+CREATE INDEX runs_user_id_run_id_idx ON runs (user_id, run_id);
 
+-- History feed and profile history: (run_date, run_id) seek cursors, newest first
+CREATE INDEX runs_run_date_run_id_idx ON runs (run_date DESC, run_id DESC);
+CREATE INDEX runs_user_id_run_date_idx ON runs (user_id, run_date DESC, run_id DESC);
 
+-- Per-user run statistics for the leaderboard, kept up to date by triggers on runs
+CREATE TABLE user_stats (
+    user_id INT PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    runs_count INT NOT NULL DEFAULT 0,
+    best_time FLOAT,
+    total_time FLOAT NOT NULL DEFAULT 0,
+    last_run TIMESTAMP
+);
+
+-- Leaderboard pages walk these in sort order (by name it walks users.username_lower);
+-- meters also counts leaderboard ranks, best the profile percentiles
+CREATE INDEX user_stats_meters_idx ON user_stats (runs_count DESC, best_time ASC, user_id) WHERE runs_count > 0;
+CREATE INDEX user_stats_best_idx ON user_stats (best_time ASC, runs_count DESC, user_id) WHERE runs_count > 0;
+CREATE INDEX user_stats_recent_idx ON user_stats (last_run DESC, user_id) WHERE runs_count > 0;
+
+-- Recompute one user's stats from their runs (after an update or delete)
+CREATE OR REPLACE FUNCTION refresh_user_stats(uid INT) RETURNS void AS $$
+    UPDATE user_stats s
+    SET runs_count = a.runs_count,
+        best_time = a.best_time,
+        total_time = a.total_time,
+        last_run = a.last_run
+    FROM (
+        SELECT COUNT(*) AS runs_count, MIN(time_seconds) AS best_time,
+               COALESCE(SUM(time_seconds), 0) AS total_time, MAX(run_date) AS last_run
+        FROM runs
+        WHERE user_id = uid
+    ) a
+    WHERE s.user_id = uid;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION runs_update_user_stats() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        -- Inserts are the hot path, so fold the new run in without rescanning
+        INSERT INTO user_stats (user_id, runs_count, best_time, total_time, last_run)
+        VALUES (NEW.user_id, 1, NEW.time_seconds, NEW.time_seconds, NEW.run_date)
+        ON CONFLICT (user_id) DO UPDATE SET
+            runs_count = user_stats.runs_count + 1,
+            best_time = LEAST(user_stats.best_time, EXCLUDED.best_time),
+            total_time = user_stats.total_time + EXCLUDED.total_time,
+            last_run = GREATEST(user_stats.last_run, EXCLUDED.last_run);
+        RETURN NEW;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO user_stats (user_id) VALUES (NEW.user_id) ON CONFLICT DO NOTHING;
+        PERFORM refresh_user_stats(NEW.user_id);
+        IF NEW.user_id <> OLD.user_id THEN
+            PERFORM refresh_user_stats(OLD.user_id);
+        END IF;
+        RETURN NEW;
+    ELSE
+        PERFORM refresh_user_stats(OLD.user_id);
+        RETURN OLD;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER runs_user_stats_insert AFTER INSERT ON runs
+    FOR EACH ROW EXECUTE FUNCTION runs_update_user_stats();
+CREATE TRIGGER runs_user_stats_update AFTER UPDATE OF user_id, time_seconds, run_date ON runs
+    FOR EACH ROW EXECUTE FUNCTION runs_update_user_stats();
+CREATE TRIGGER runs_user_stats_delete AFTER DELETE ON runs
+    FOR EACH ROW EXECUTE FUNCTION runs_update_user_stats();
+
+-- Single-row counters read by the index page instead of COUNT(*) on runs.
+-- config_version is bumped whenever config.json is saved, so workers know to re-read it.
+CREATE TABLE site_state (
+    id INT PRIMARY KEY CHECK (id = 1),
+    runs_total BIGINT NOT NULL DEFAULT 0,
+    config_version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION runs_update_site_state() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE site_state SET runs_total = runs_total + 1 WHERE id = 1;
+    ELSE
+        UPDATE site_state SET runs_total = runs_total - 1 WHERE id = 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER runs_site_state AFTER INSERT OR DELETE ON runs
+    FOR EACH ROW EXECUTE FUNCTION runs_update_site_state();
+
+INSERT INTO site_state (id) VALUES (1);
+
+-- Live updates (/events, see utils/events.py): one NOTIFY per statement on runs,
+-- carrying the new total and up to 10 of the inserted runs. Statement-level
+-- triggers run after the row-level runs_site_state trigger, so runs_total is current,
+-- and a bulk import sends one notification instead of one per row.
+CREATE OR REPLACE FUNCTION runs_notify_inserted() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('usainbolt_events', json_build_object(
+        'type', 'runs',
+        'total_runs', (SELECT runs_total FROM site_state WHERE id = 1),
+        'new_runs', (
+            SELECT COALESCE(json_agg(r), '[]') FROM (
+                SELECT n.run_id, n.user_id, u.username, n.time_seconds, n.run_date
+                FROM new_runs n JOIN users u ON u.user_id = n.user_id
+                ORDER BY n.run_date DESC, n.run_id DESC
+                LIMIT 10
+            ) r
+        )
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION runs_notify_deleted() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('usainbolt_events', json_build_object(
+        'type', 'runs',
+        'total_runs', (SELECT runs_total FROM site_state WHERE id = 1)
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER runs_notify_insert AFTER INSERT ON runs
+    REFERENCING NEW TABLE AS new_runs
+    FOR EACH STATEMENT EXECUTE FUNCTION runs_notify_inserted();
+CREATE TRIGGER runs_notify_delete AFTER DELETE ON runs
+    FOR EACH STATEMENT EXECUTE FUNCTION runs_notify_deleted();
+
+-- Resized profile pictures (see utils/images.py), stored in the blob store next to the original
+CREATE TABLE avatar_variants (
+    user_id INT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    size INT NOT NULL,
+    format VARCHAR(10) NOT NULL,
+    sha256 CHAR(64) NOT NULL,
+    bytes INT NOT NULL,
+    mime VARCHAR(50) NOT NULL,
+    PRIMARY KEY (user_id, size, format)
+);
+
+-- Background jobs (utils/jobs.py, run by worker.py)
+CREATE TABLE jobs (
+    job_id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(10) NOT NULL DEFAULT 'queued',  -- queued, running, done, dead
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),  -- next try, or end of the lease while running
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
+-- Claiming: due jobs in order, finished ones stay out of the index
+CREATE INDEX jobs_due_idx ON jobs (run_after, job_id) WHERE status IN ('queued', 'running');
@@ -0,0 +1,39 @@
+// Username suggestions for an <input list="..."> from /api/users/search,
+// fetched as the user types instead of rendering every username into the page.
+function attachUserSearch(input, datalist, searchUrl) {
+    let timer = null;
+    let controller = null;
+    const known = new Map();  // lowercased query -> does a user with exactly that name exist
+
+    function search(name) {
+        const q = name.trim().toLowerCase();
+        if (!q) return Promise.resolve(false);
+        if (known.has(q)) return Promise.resolve(known.get(q));
+
+        if (controller) controller.abort();
+        controller = new AbortController();
+        return fetch(`${searchUrl}?q=${encodeURIComponent(q)}`, { signal: controller.signal })
+            .then(response => response.json())
+            .then(data => {
+                datalist.replaceChildren(...data.users.map(user => {
+                    const option = document.createElement("option");
+                    option.value = user.username;
+                    return option;
+                }));
+                known.set(q, data.exact);
+                return data.exact;
+            });
+    }
+
+    input.addEventListener("input", () => {
+        clearTimeout(timer);
+        timer = setTimeout(() => {
+            search(input.value)
+                .then(exists => input.dispatchEvent(new CustomEvent("usercheck", { detail: { exists } })))
+                .catch(() => {});  // aborted by a newer keystroke
+        }, 150);
+    });
+
+    // Resolves to whether the current value is an existing user
+    return { exists: () => search(input.value) };
+}
@@ -0,0 +1,104 @@
+import io
+import struct
+
+from utils.mp4 import faststart, iter_boxes, parse_boxes, _walk, _chunk_offsets
+
+# Synthetic files: ftyp, then mdat with one chunk per stco entry, then moov
+CHUNKS = [b"chunk-one", b"chunk-two!", b"chunk-three"]
+
+
+def box(kind, payload):
+    return struct.pack(">I4s", len(payload) + 8, kind) + payload
+
+
+def full_box(kind, payload, version=0):
+    return box(kind, struct.pack(">B3x", version) + payload)
+
+
+def moov(offsets, table=b"stco"):
+    fmt = "I" if table == b"stco" else "Q"
+    mvhd = full_box(b"mvhd", struct.pack(">IIII", 0, 0, 1000, 2500) + bytes(80))
+    # tkhd v0: times, track id, reserved, duration, reserved, layer/group/volume/reserved, matrix, width, height
+    identity = struct.pack(">9i", 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+    tkhd = full_box(b"tkhd", bytes(20) + bytes(8) + bytes(8) + identity + struct.pack(">II", 640 << 16, 360 << 16))
+    hdlr = full_box(b"hdlr", bytes(4) + b"vide" + bytes(12) + b"\0")
+    stco = full_box(table, struct.pack(f">I{len(offsets)}{fmt}", len(offsets), *offsets))
+    stbl = box(b"stbl", stco)
+    minf = box(b"minf", stbl)
+    mdia = box(b"mdia", hdlr + minf)
+    trak = box(b"trak", tkhd + mdia)
+    return box(b"moov", mvhd + trak)
+
+
+def ftyp():
+    return box(b"ftyp", b"isom" + struct.pack(">I", 512) + b"isomiso2mp41")
+
+
+def moov_last_file():
+    head = ftyp()
+    mdat_data_start = len(head) + 8
+    offsets, position = [], mdat_data_start
+    for chunk in CHUNKS:
+        offsets.append(position)
+        position += len(chunk)
+    return head + box(b"mdat", b"".join(CHUNKS)) + moov(offsets), offsets
+
+
+def offsets_of(data):
+    f = io.BytesIO(data)
+    moov_box = next((offset, size) for kind, offset, size in iter_boxes(f, len(data)) if kind == b"moov")
+    tree = parse_boxes(data[moov_box[0] + 8:moov_box[0] + moov_box[1]])
+    tables = list(_walk(tree, b"stco")) + list(_walk(tree, b"co64"))
+    return [(table[0], _chunk_offsets(table)) for table in tables]
+
+
+def test_moves_moov_and_shifts_stco_offsets():
+    data, _ = moov_last_file()
+    info, chunks = faststart(io.BytesIO(data), len(data))
+    assert chunks is not None
+    out = b"".join(chunks)
+
+    assert len(out) == len(data)
+    assert [kind for kind, _, _ in iter_boxes(io.BytesIO(out), len(out))] == [b"ftyp", b"moov", b"mdat"]
+    [(kind, offsets)] = offsets_of(out)
+    assert kind == b"stco"
+    # Every offset still points at its chunk
+    assert [out[offset:offset + len(chunk)] for offset, chunk in zip(offsets, CHUNKS)] == CHUNKS
+    assert info.duration == 2.5
+    assert (info.width, info.height) == (640, 360)
+
+
+def test_switches_to_co64_when_offsets_outgrow_32_bits():
+    head = ftyp()
+    mdat = box(b"mdat", b"".join(CHUNKS))
+    near_limit = 0xFFFFFFFC
+    # The last chunk lies (nominally) far behind moov, so moving moov pushes it past 2^32
+    offsets = [len(head) + 8, near_limit]
+    old_moov = moov(offsets)
+    data = head + mdat + old_moov
+    _, chunks = faststart(io.BytesIO(data), len(data))
+    out = b"".join(chunks)
+
+    [(kind, new_offsets)] = offsets_of(out)
+    assert kind == b"co64"
+    new_moov_size = len(moov(offsets, b"co64"))
+    assert new_offsets == [offsets[0] + new_moov_size, near_limit + new_moov_size - len(old_moov)]
+    assert new_offsets[1] > 0xFFFFFFFF
+    assert out[new_offsets[0]:new_offsets[0] + len(CHUNKS[0])] == CHUNKS[0]
+
+
+def test_faststart_file_is_left_alone():
+    head = ftyp()
+    # moov first: chunk offsets count from the start of the file, behind moov
+    sizing_moov = moov([0] * len(CHUNKS))
+    position = len(head) + len(sizing_moov) + 8
+    offsets = []
+    for chunk in CHUNKS:
+        offsets.append(position)
+        position += len(chunk)
+    data = head + moov(offsets) + box(b"mdat", b"".join(CHUNKS))
+
+    info, chunks = faststart(io.BytesIO(data), len(data))
+    assert chunks is None
+    assert info.duration == 2.5
+    assert offsets_of(data) == [(b"stco", offsets)]
@@ -0,0 +1,196 @@
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+from pathlib import Path
+
+from flask import current_app, request, send_from_directory, url_for
+from PIL import Image
+
+try:
+    import brotli
+except ImportError:  # optional, only build_assets.py needs it; without it only .gz files are written
+    brotli = None
+
+# Build output (fingerprinted copies + manifest.json) inside the static folder
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+
+# Files in static/ that get fingerprinted copies
+ASSET_SUFFIXES = {".css", ".js", ".svg", ".png", ".jpg", ".jpeg"}
+# Text assets that are also stored gzip/brotli compressed
+COMPRESSIBLE_SUFFIXES = {".css", ".js", ".svg"}
+RASTER_SUFFIXES = {".png", ".jpg", ".jpeg"}
+# Editing sources, e.g. bong_empty_original.png, are not published
+SOURCE_MARKER = "_original"
+
+# Modern formats written next to every raster image, best first: format -> (Pillow format, MIME type, save options)
+IMAGE_FORMATS = {
+    "avif": ("AVIF", "image/avif", {"quality": 60}),
+    "webp": ("WEBP", "image/webp", {"quality": 85, "method": 6}),
+}
+
+# Fingerprinted names change with their content, so they can be cached for good
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+# -----------------------
+# Building (build_assets.py)
+# -----------------------
+def crop_fractions(img, left=0.0, top=0.0, right=0.0, bottom=0.0):
+    """Cut the given share of the width/height off each side"""
+    w, h = img.size
+    return img.crop((int(w * left), int(h * top), w - int(w * right), h - int(h * bottom)))
+
+
+def prepare_image(src, dest, rotate=0, crop=None, size=None):
+    """Rotate (degrees clockwise), crop (fractions per side) and resize an image, in that order"""
+    with Image.open(src) as img:
+        if rotate:
+            img = img.rotate(-rotate, expand=True)
+        if crop:
+            img = crop_fractions(img, *crop)
+        if size:
+            img = img.resize(size, Image.LANCZOS)
+        img.save(dest)
+
+
+def _fingerprinted(name, data):
+    path = Path(name)
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    return (path.parent / f"{path.stem}.{digest}{path.suffix}").as_posix()
+
+
+def _encode(img, fmt):
+    pil_format, mime, options = IMAGE_FORMATS[fmt]
+    out = io.BytesIO()
+    img.save(out, pil_format, **options)
+    return out.getvalue(), mime
+
+
+def _supported(fmt):
+    return f".{fmt}" in Image.registered_extensions()
+
+
+def build(static_folder, log=print):
+    """
+    Write fingerprinted copies of the static files to static/dist, plus AVIF/WebP
+    versions of images and .gz/.br versions of text files, and return the manifest:
+      files:      logical name -> fingerprinted name (both relative to static/)
+      images:     logical name -> [(fingerprinted name, MIME type)] of the modern formats
+      compressed: fingerprinted name -> encodings stored next to it
+    """
+    static_folder = Path(static_folder)
+    dist = static_folder / DIST_DIR
+    manifest = {"files": {}, "images": {}, "compressed": {}}
+
+    def write(name, data):
+        path = static_folder / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+    sources = sorted(
+        path for path in static_folder.rglob("*")
+        if path.is_file() and path.suffix.lower() in ASSET_SUFFIXES
+        and dist not in path.parents and SOURCE_MARKER not in path.stem
+    )
+    for path in sources:
+        logical = path.relative_to(static_folder).as_posix()
+        data = path.read_bytes()
+        suffix = path.suffix.lower()
+        target = _fingerprinted(f"{DIST_DIR}/{logical}", data)
+        write(target, data)
+        manifest["files"][logical] = target
+
+        if suffix in COMPRESSIBLE_SUFFIXES:
+            encodings = {"gzip": (".gz", gzip.compress(data, 9, mtime=0))}
+            if brotli is not None:
+                encodings["br"] = (".br", brotli.compress(data, quality=11))
+            stored = []
+            for encoding, (extension, compressed) in encodings.items():
+                if len(compressed) < len(data):
+                    write(target + extension, compressed)
+                    stored.append(encoding)
+            manifest["compressed"][target] = stored
+            log(f"{logical} -> {target} ({len(data)} bytes, {', '.join(stored) or 'uncompressed'})")
+
+        elif suffix in RASTER_SUFFIXES:
+            variants = []
+            with Image.open(path) as img:
+                img.load()
+                for fmt in IMAGE_FORMATS:
+                    if not _supported(fmt):
+                        log(f"  Pillow can't write {fmt.upper()}, skipping it")
+                        continue
+                    encoded, mime = _encode(img, fmt)
+                    if len(encoded) >= len(data):
+                        continue  # no smaller than the original, not worth a <source>
+                    name = _fingerprinted(f"{DIST_DIR}/{Path(logical).with_suffix('.' + fmt).as_posix()}", encoded)
+                    write(name, encoded)
+                    variants.append((name, mime))
+            manifest["images"][logical] = variants
+            sizes = ", ".join(f"{mime.split('/')[1]} {(static_folder / name).stat().st_size}" for name, mime in variants)
+            log(f"{logical} -> {target} ({len(data)} bytes{', ' + sizes if sizes else ''})")
+        else:
+            log(f"{logical} -> {target}")
+
+    write(f"{DIST_DIR}/{MANIFEST_NAME}", json.dumps(manifest, indent=2).encode())
+    return manifest
+
+
+# -----------------------
+# Serving
+# -----------------------
+_manifest = {"files": {}, "images": {}, "compressed": {}}
+
+
+def _fingerprint_static(endpoint, values):
+    """url_for('static', filename='style.css') -> /static/dist/style.<hash>.css once built"""
+    if endpoint == "static" and "filename" in values:
+        values["filename"] = _manifest["files"].get(values["filename"], values["filename"])
+
+
+def image_sources(filename):
+    """(url, MIME type) of the AVIF/WebP versions of a static image, for <picture><source>"""
+    return [(url_for("static", filename=name), mime) for name, mime in _manifest["images"].get(filename, ())]
+
+
+def _serve_static(filename):
+    if not filename.startswith(DIST_DIR + "/"):
+        return current_app.send_static_file(filename)
+
+    encodings = _manifest["compressed"].get(filename, ())
+    for encoding in ("br", "gzip"):
+        if encoding in encodings and request.accept_encodings[encoding]:
+            extension = ".br" if encoding == "br" else ".gz"
+            response = send_from_directory(
+                current_app.static_folder, filename + extension, mimetype=mimetypes.guess_type(filename)[0]
+            )
+            response.headers["Content-Encoding"] = encoding
+            break
+    else:
+        response = current_app.send_static_file(filename)
+    if encodings:
+        response.vary.add("Accept-Encoding")
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def init_app(app):
+    """
+    Serve the output of build_assets.py: url_for('static', ...) points at the
+    fingerprinted copies, which are sent precompressed and cached as immutable.
+    Without a build (development) the plain files are served as before.
+    """
+    manifest_path = Path(app.static_folder) / DIST_DIR / MANIFEST_NAME
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text())
+        _manifest.update(
+            files=manifest["files"],
+            images={name: [tuple(variant) for variant in variants] for name, variants in manifest["images"].items()},
+            compressed=manifest["compressed"],
+        )
+    app.url_defaults(_fingerprint_static)
+    app.view_functions["static"] = _serve_static
+    app.jinja_env.globals["image_sources"] = image_sources
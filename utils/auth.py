@@ -0,0 +1,176 @@
+import hashlib
+import hmac
+import logging
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger("usainbolt.auth")
+
+# Admin login attempts per client IP: a burst of ADMIN_LOGIN_BURST, then ADMIN_LOGIN_PER_MINUTE
+ADMIN_LOGIN_PER_MINUTE = float(os.getenv("ADMIN_LOGIN_PER_MINUTE", "5"))
+ADMIN_LOGIN_BURST = int(os.getenv("ADMIN_LOGIN_BURST", "5"))
+# Same for all clients together (per worker), so many addresses can't keep the hashing busy either
+ADMIN_LOGIN_GLOBAL_PER_MINUTE = float(os.getenv("ADMIN_LOGIN_GLOBAL_PER_MINUTE", "60"))
+ADMIN_LOGIN_GLOBAL_BURST = int(os.getenv("ADMIN_LOGIN_GLOBAL_BURST", "10"))
+# Processes (per worker) hashing passwords; at most this many hashes run at once
+ADMIN_HASH_PROCESSES = int(os.getenv("ADMIN_HASH_PROCESSES", "2"))
+# How long a password that was verified is trusted again in the same session without hashing
+ADMIN_VERIFY_CACHE_SECONDS = float(os.getenv("ADMIN_VERIFY_CACHE_SECONDS", "300"))
+
+# Client addresses tracked by the rate limiter, least recently seen are forgotten first
+MAX_TRACKED_CLIENTS = 10000
+# Longest a login waits for a free hashing process before it is turned away
+HASH_QUEUE_SECONDS = 2.0
+
+
+class LoginThrottled(Exception):
+    """Too many login attempts right now; retry_after is in seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class VerifierUnavailable(Exception):
+    """The hashing pool broke or hung; it is rebuilt for the next attempt"""
+
+
+class TokenBucket:
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def wait(self, now):
+        """Refill, then 0 if a token is available, otherwise seconds until there is one"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+    def take(self):
+        """Spend a token (after wait() said one is available)"""
+        self.tokens -= 1
+
+
+class RateLimiter:
+    """A token bucket per client plus one shared by all of them"""
+
+    def __init__(self, per_minute=ADMIN_LOGIN_PER_MINUTE, burst=ADMIN_LOGIN_BURST,
+                 global_per_minute=ADMIN_LOGIN_GLOBAL_PER_MINUTE, global_burst=ADMIN_LOGIN_GLOBAL_BURST):
+        self.per_minute, self.burst = per_minute, burst
+        self.overall = TokenBucket(global_per_minute, global_burst)
+        self.clients = OrderedDict()
+        self.lock = threading.Lock()
+
+    def check(self, client):
+        """Raise LoginThrottled if `client` (or everyone together) is over the limit"""
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.clients.pop(client, None) or TokenBucket(self.per_minute, self.burst)
+            self.clients[client] = bucket
+            if len(self.clients) > MAX_TRACKED_CLIENTS:
+                self.clients.popitem(last=False)
+            # Both buckets must have a token before either is spent
+            retry_after = max(bucket.wait(now), self.overall.wait(now))
+            if not retry_after:
+                bucket.take()
+                self.overall.take()
+        if retry_after:
+            raise LoginThrottled(retry_after)
+
+
+def pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+
+
+class PasswordVerifier:
+    """
+    Checks the admin password with PBKDF2 in a small process pool, so login
+    attempts can't take the CPU away from the threads serving pages, and
+    remembers successful checks per session for ADMIN_VERIFY_CACHE_SECONDS.
+    """
+
+    def __init__(self, credentials, processes=ADMIN_HASH_PROCESSES, cache_seconds=ADMIN_VERIFY_CACHE_SECONDS):
+        self.credentials = credentials  # () -> (salt, hash, iterations)
+        self.processes = processes
+        self.cache_seconds = cache_seconds
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(self.processes)
+        self.executor = None
+        # Cache keys are keyed hashes of (session, password), the password itself is not kept
+        self.key = secrets.token_bytes(32)
+        self.verified = {}
+
+    def _executor(self):
+        with self.lock:
+            if self.executor is None:
+                # forkserver: the hashing processes don't inherit this worker's threads and connections
+                self.executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("forkserver"))
+            return self.executor
+
+    def _cache_key(self, session_id, password):
+        return hmac.new(self.key, f"{session_id}\0{password}".encode("utf-8"), hashlib.sha256).digest()
+
+    def verify(self, password, session_id):
+        """
+        True if `password` is the admin password. Raises LoginThrottled if all
+        hashing processes are busy, VerifierUnavailable if the pool failed.
+        """
+        cache_key = self._cache_key(session_id, password)
+        now = time.monotonic()
+        with self.lock:
+            if self.verified.get(cache_key, 0) > now:
+                return True
+
+        salt, expected, iterations = self.credentials()
+        if not self.slots.acquire(timeout=HASH_QUEUE_SECONDS):
+            raise LoginThrottled(HASH_QUEUE_SECONDS)
+        try:
+            derived = self._executor().submit(pbkdf2, password, salt, iterations).result(timeout=30)
+        except (BrokenProcessPool, FutureTimeout) as e:
+            logger.warning("password hashing failed, restarting the pool: %r", e)
+            with self.lock:
+                executor, self.executor = self.executor, None  # start a fresh pool next time
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise VerifierUnavailable() from e
+        finally:
+            self.slots.release()
+
+        ok = hmac.compare_digest(derived, expected)
+        if ok:
+            with self.lock:
+                self.verified = {key: expires for key, expires in self.verified.items() if expires > now}
+                self.verified[cache_key] = now + self.cache_seconds
+        return ok
+
+
+_verifiers = []
+
+
+def _reset_after_fork():
+    # The pool's processes and threads belong to the parent
+    for verifier in _verifiers:
+        verifier.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def create_verifier(credentials):
+    verifier = PasswordVerifier(credentials)
+    _verifiers.append(verifier)
+    return verifier
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import tempfile
+from collections import namedtuple
+from pathlib import Path
+
+# What the database keeps about a stored blob (the MIME type lives next to it)
+BlobRef = namedtuple("BlobRef", ["digest", "size"])
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BlobStore:
+    """
+    Interface for content-addressed blob storage.
+    Blobs are keyed by the hex SHA-256 of their content, so storing the
+    same bytes twice only keeps one copy.
+    """
+
+    def put_chunks(self, chunks):
+        """Store an iterable of byte chunks and return its BlobRef"""
+        raise NotImplementedError
+
+    def put(self, fileobj, chunk_size=CHUNK_SIZE):
+        """Store a readable file object without reading it into memory at once"""
+        return self.put_chunks(iter(lambda: fileobj.read(chunk_size), b""))
+
+    def path(self, digest):
+        """Local filesystem path of a blob (so it can be served with sendfile)"""
+        raise NotImplementedError
+
+    def exists(self, digest):
+        raise NotImplementedError
+
+    def delete(self, digest):
+        raise NotImplementedError
+
+    def iter_digests(self):
+        """Yield (digest, mtime) for every stored blob"""
+        raise NotImplementedError
+
+    def purge_temp(self, older_than):
+        """Delete temp files last written before `older_than` (left behind by failed uploads), returns how many"""
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Blobs stored as files under `root`, sharded into two levels of
+    directories by digest prefix: root/ab/cd/abcd....
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.tmp_dir = self.root / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    def path(self, digest):
+        return self.root / digest[0:2] / digest[2:4] / digest
+
+    def exists(self, digest):
+        return self.path(digest).exists()
+
+    def temp_file(self):
+        """Open a temp file on the same filesystem, so it can be renamed into place"""
+        return tempfile.NamedTemporaryFile(dir=self.tmp_dir, delete=False)
+
+    def put_chunks(self, chunks):
+        hasher = hashlib.sha256()
+        size = 0
+        with self.temp_file() as tmp:
+            try:
+                for chunk in chunks:
+                    hasher.update(chunk)
+                    size += len(chunk)
+                    tmp.write(chunk)
+            except BaseException:
+                tmp.close()
+                os.unlink(tmp.name)
+                raise
+        return self.adopt(tmp.name, hasher.hexdigest(), size)
+
+    def adopt(self, tmp_path, digest, size):
+        """Move an already hashed temp file into the store (or drop it if it's a duplicate)"""
+        target = self.path(digest)
+        try:
+            # Fresh mtime: garbage collection must not take a blob that was just referenced again
+            os.utime(target)
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(tmp_path, target)
+        return BlobRef(digest, size)
+
+    def delete(self, digest):
+        try:
+            os.unlink(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def iter_digests(self):
+        for first in self.root.iterdir():
+            if not first.is_dir() or first == self.tmp_dir:
+                continue
+            for blob in first.glob("*/*"):
+                yield blob.name, blob.stat().st_mtime
+
+    def purge_temp(self, older_than):
+        removed = 0
+        for tmp in self.tmp_dir.iterdir():
+            try:
+                if tmp.stat().st_mtime < older_than:
+                    tmp.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass  # adopted or cleaned up meanwhile
+        return removed
+
+
+BACKENDS = {
+    "local": lambda: LocalBlobStore(os.getenv("BLOB_STORE_DIR", "media")),
+}
+
+_store = None
+
+
+def get_blob_store():
+    """Return the configured blob store (BLOB_STORE_BACKEND, default 'local')"""
+    global _store
+    if _store is None:
+        _store = BACKENDS[os.getenv("BLOB_STORE_BACKEND", "local")]()
+    return _store
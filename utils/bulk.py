@@ -0,0 +1,285 @@
+import csv
+import queue
+import tarfile
+import tempfile
+import threading
+
+from utils.psql import psql_copy, psql_iter, transaction
+from utils.blobstore import get_blob_store
+
+# Metadata columns per table, in export order (imports expect the same layout)
+EXPORTS = {
+    "users": """
+        SELECT user_id, username, profile_picture_sha256, profile_picture_size, profile_picture_mime
+        FROM users ORDER BY user_id
+    """,
+    "runs": """
+        SELECT r.run_id, r.user_id, u.username, r.description, r.time_seconds, r.run_date,
+               r.video_sha256, r.video_size, r.video_mime, r.video_duration, r.video_width, r.video_height
+        FROM runs r JOIN users u ON u.user_id = r.user_id
+        ORDER BY r.run_id
+    """,
+}
+
+STAGING = {
+    "users": """
+        CREATE TEMP TABLE import_users (
+            user_id INT, username VARCHAR(255), profile_picture_sha256 CHAR(64),
+            profile_picture_size BIGINT, profile_picture_mime VARCHAR(50)
+        ) ON COMMIT DROP;
+    """,
+    "runs": """
+        CREATE TEMP TABLE import_runs (
+            run_id INT, user_id INT, username VARCHAR(255), description TEXT, time_seconds FLOAT,
+            run_date TIMESTAMP, video_sha256 CHAR(64), video_size BIGINT, video_mime VARCHAR(50),
+            video_duration FLOAT, video_width INT, video_height INT
+        ) ON COMMIT DROP;
+    """,
+}
+
+# Staging columns a CSV header may name, in any order and subset (older exports lack newer columns)
+STAGING_COLUMNS = {
+    "users": ("user_id", "username", "profile_picture_sha256", "profile_picture_size", "profile_picture_mime"),
+    "runs": ("run_id", "user_id", "username", "description", "time_seconds", "run_date", "video_sha256",
+             "video_size", "video_mime", "video_duration", "video_width", "video_height"),
+}
+# Columns every CSV header must name, the merge can't fill them in
+REQUIRED_COLUMNS = {
+    "users": ("username",),
+    "runs": ("username", "time_seconds"),
+}
+
+# Merge staged rows into the real tables. Users are matched by name (ids differ
+# between environments), runs already present for the same user, date and time are skipped.
+# Runs without a date are dated at the import.
+MERGE = {
+    "users": """
+        INSERT INTO users (username, username_lower, profile_picture_sha256, profile_picture_size, profile_picture_mime)
+        SELECT DISTINCT ON (LOWER(username)) username, LOWER(username),
+               profile_picture_sha256, profile_picture_size, profile_picture_mime
+        FROM import_users
+        ORDER BY LOWER(username), user_id
+        ON CONFLICT (username_lower) DO UPDATE SET
+            profile_picture_sha256 = COALESCE(EXCLUDED.profile_picture_sha256, users.profile_picture_sha256),
+            profile_picture_size = COALESCE(EXCLUDED.profile_picture_size, users.profile_picture_size),
+            profile_picture_mime = COALESCE(EXCLUDED.profile_picture_mime, users.profile_picture_mime);
+    """,
+    "runs": """
+        INSERT INTO users (username, username_lower)
+        SELECT DISTINCT ON (LOWER(username)) username, LOWER(username) FROM import_runs
+        ON CONFLICT (username_lower) DO NOTHING;
+
+        INSERT INTO runs (user_id, description, time_seconds, run_date, video_sha256, video_size, video_mime,
+                          video_duration, video_width, video_height)
+        SELECT u.user_id, i.description, i.time_seconds, COALESCE(i.run_date, NOW()),
+               i.video_sha256, i.video_size, i.video_mime, i.video_duration, i.video_width, i.video_height
+        FROM import_runs i
+        JOIN users u ON u.username_lower = LOWER(i.username)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM runs r
+            WHERE r.user_id = u.user_id AND r.run_date = i.run_date AND r.time_seconds = i.time_seconds
+        )
+        ORDER BY i.run_date, i.run_id;
+    """,
+}
+
+DIGEST_COLUMNS = {"users": "profile_picture_sha256", "runs": "video_sha256"}
+
+# NDJSON goes through COPY as a single raw text column: CSV mode with quote and
+# delimiter characters that never occur in JSON, so nothing gets escaped
+RAW_LINES = "WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+
+def copy_out_query(table, fmt):
+    if fmt == "csv":
+        return f"COPY ({EXPORTS[table]}) TO STDOUT WITH (FORMAT csv, HEADER);"
+    return f"COPY (SELECT row_to_json(t) FROM ({EXPORTS[table]}) t) TO STDOUT {RAW_LINES};"
+
+
+def export_table(table, fmt, fileobj):
+    """Write one table's metadata as CSV or NDJSON straight from COPY TO STDOUT"""
+    psql_copy(copy_out_query(table, fmt), fileobj)
+
+
+def export_bundle(fileobj, media=True):
+    """
+    Write a tar stream: media/<sha256> blobs (optional) first, then users.csv
+    and runs.csv. Metadata is spooled to a temp file because tar needs sizes up front.
+    """
+    store = get_blob_store()
+    with tarfile.open(fileobj=fileobj, mode="w|") as tar:
+        if media:
+            digests = psql_iter("""
+                SELECT profile_picture_sha256 FROM users WHERE profile_picture_sha256 IS NOT NULL
+                UNION
+                SELECT video_sha256 FROM runs WHERE video_sha256 IS NOT NULL;
+            """, row_type="tuple")
+            for (digest,) in digests:
+                path = store.path(digest)
+                if path.exists():
+                    tar.add(path, arcname=f"media/{digest}")
+
+        for table in ("users", "runs"):
+            with tempfile.TemporaryFile() as spool:
+                export_table(table, "csv", spool)
+                info = tarfile.TarInfo(f"{table}.csv")
+                info.size = spool.tell()
+                spool.seek(0)
+                tar.addfile(info, spool)
+
+
+def csv_columns(table, fileobj):
+    """
+    Read the header line of a CSV import and return its columns, so files
+    exported before a column was added still load (missing optional ones stay NULL).
+    Raises ValueError for columns the table doesn't have or required ones it lacks.
+    """
+    line = fileobj.readline().decode("utf-8-sig")
+    if not line.strip():
+        return []
+    columns = next(csv.reader([line]))
+    unknown = [column for column in columns if column not in STAGING_COLUMNS[table]]
+    if unknown or len(set(columns)) != len(columns):
+        raise ValueError(f"unexpected columns in {table} CSV header: {', '.join(unknown) or 'duplicates'}")
+    missing = [column for column in REQUIRED_COLUMNS[table] if column not in columns]
+    if missing:
+        raise ValueError(f"{table} CSV header lacks required columns: {', '.join(missing)}")
+    return columns
+
+
+def import_table(table, fmt, fileobj):
+    """
+    Load CSV (with a header naming the columns) or NDJSON into `table` at COPY speed:
+    COPY into a temp staging table, then merge with one INSERT ... SELECT.
+    Returns the number of rows read.
+    """
+    store = get_blob_store()
+    with transaction() as tx:
+        tx.execute(STAGING[table], fetch=False)
+        if fmt == "csv":
+            columns = csv_columns(table, fileobj)
+            if not columns:
+                return 0
+            count = psql_copy(f"COPY import_{table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv);", fileobj)
+        else:
+            tx.execute("CREATE TEMP TABLE import_json (doc JSON) ON COMMIT DROP;", fetch=False)
+            count = psql_copy(f"COPY import_json (doc) FROM STDIN {RAW_LINES};", fileobj)
+            tx.execute(f"""
+                INSERT INTO import_{table}
+                SELECT r.* FROM import_json, json_populate_record(NULL::import_{table}, doc) r;
+            """, fetch=False)
+
+        # Don't point rows at media this environment doesn't have
+        column = DIGEST_COLUMNS[table]
+        digests = tx.execute(f"SELECT DISTINCT {column} FROM import_{table} WHERE {column} IS NOT NULL;")
+        missing = [row[0] for row in digests if not store.exists(row[0])]
+        if missing:
+            tx.execute(f"UPDATE import_{table} SET {column} = NULL WHERE {column} = ANY(%s);", (missing,), fetch=False)
+
+        tx.execute(MERGE[table], fetch=False)
+    return count
+
+
+def import_bundle(fileobj):
+    """Read a tar stream made by export_bundle(); returns {name: rows or blobs}"""
+    store = get_blob_store()
+    counts = {"media": 0}
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            data = tar.extractfile(member)
+            if member.name.startswith("media/"):
+                blob = store.put(data)
+                if blob.digest == member.name.split("/", 1)[1]:
+                    counts["media"] += 1
+            elif member.name in ("users.csv", "runs.csv"):
+                table = member.name.split(".")[0]
+                counts[table] = import_table(table, "csv", data)
+    return counts
+
+
+class _QueueWriter:
+    """File object whose writes are handed to another thread in ~64 KiB chunks"""
+
+    CHUNK = 64 * 1024
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=16)  # bounds memory, the producer waits for the client
+        self.buffer = bytearray()
+        self.cancelled = False
+
+    def put(self, item):
+        while True:
+            if self.cancelled:
+                raise BrokenPipeError("export cancelled")
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data):
+        self.buffer += data.encode("utf-8") if isinstance(data, str) else data
+        if len(self.buffer) >= self.CHUNK:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.buffer:
+            self.put(bytes(self.buffer))
+            self.buffer.clear()
+
+
+_DONE = object()
+
+
+def stream_writer(produce):
+    """
+    Run produce(fileobj) in a background thread and yield what it writes, so
+    COPY TO STDOUT / tar output can be streamed as an HTTP response.
+    """
+    writer = _QueueWriter()
+    errors = []
+
+    def run():
+        try:
+            produce(writer)
+            writer.flush()
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            try:
+                writer.put(_DONE)
+            except BrokenPipeError:
+                pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = writer.queue.get()
+            if item is _DONE:
+                break
+            yield item
+        if errors:
+            raise errors[0]
+    finally:
+        writer.cancelled = True
+        thread.join(timeout=5)
+
+
+def ndjson_or_csv(filename, default="csv"):
+    """Guess the metadata format from a file name"""
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl", ".json")):
+        return "ndjson"
+    if name.endswith(".csv"):
+        return "csv"
+    return default
+
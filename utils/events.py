@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import queue
+import random
+import select
+import threading
+import time
+
+import psycopg2
+
+from utils.psql import psql, db_config
+
+logger = logging.getLogger("usainbolt.events")
+
+# Postgres channel the runs triggers and notify() publish on
+CHANNEL = "usainbolt_events"
+# SSE comment sent to idle clients so proxies don't close the connection
+HEARTBEAT_SECONDS = 15
+# Events buffered per client; a client that falls this far behind is dropped and reconnects
+CLIENT_QUEUE_SIZE = 100
+# Open streams per worker; each holds a gunicorn thread (see gunicorn.conf.py). Clients over
+# the limit poll instead: they get the current state and reconnect after EVENTS_POLL_SECONDS
+EVENTS_MAX_CLIENTS = int(os.getenv("EVENTS_MAX_CLIENTS", "16"))
+# Seconds a polling client waits before asking again, jittered up to twice that so they spread out
+EVENTS_POLL_SECONDS = float(os.getenv("EVENTS_POLL_SECONDS", "10"))
+
+
+def notify(kind, **data):
+    """Publish an event to every worker's listener (delivered when the transaction commits)"""
+    psql("SELECT pg_notify(%s, %s);", (CHANNEL, json.dumps({"type": kind, **data})), fetch=False, replica=False)
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class Subscriber:
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.dropped = False
+
+
+class EventBroker:
+    """
+    One LISTEN connection per worker process, fanned out to every connected
+    /events client. The current state (total runs, goal) is kept in memory and
+    sent to new clients right away, so watchers cost no queries at all: the
+    database only sends the notifications, once per worker.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot  # () -> {"total_runs": ..., "goal": ...}, read when (re)connecting
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.state = None
+        self.ready = threading.Event()
+        self.thread = None
+
+    def subscribe(self):
+        """A new Subscriber, or None if EVENTS_MAX_CLIENTS streams are open already"""
+        with self.lock:
+            self._start_listener()
+            if len(self.subscribers) >= EVENTS_MAX_CLIENTS:
+                return None
+            subscriber = Subscriber()
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def _start_listener(self):
+        # Called with the lock held
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._listen, name="event-listener", daemon=True)
+            self.thread.start()
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def _broadcast(self, message):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(message)
+            except queue.Full:
+                subscriber.dropped = True
+                self.unsubscribe(subscriber)
+
+    def _set_state(self, **changes):
+        self.state = {**(self.state or {}), **changes}
+        self.ready.set()
+        self._broadcast(sse("state", self.state))
+
+    def _handle(self, event):
+        if event.get("type") == "runs":
+            self._set_state(total_runs=event["total_runs"])
+            for run in reversed(event.get("new_runs") or []):  # oldest first
+                self._broadcast(sse("run", run))
+        elif event.get("type") == "config":
+            self._set_state(goal=event["goal"])
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**db_config)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL};")
+                # Listening first, then reading the state: no update can fall in between
+                self._set_state(**self.snapshot())
+                backoff = 1
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notification = conn.notifies.pop(0)
+                        try:
+                            self._handle(json.loads(notification.payload))
+                        except (ValueError, KeyError):
+                            logger.warning("ignoring malformed event %r", notification.payload)
+            except Exception as e:
+                logger.warning("event listener disconnected, retrying in %ss: %s", backoff, e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+
+    def stream(self, subscriber):
+        """SSE body for one client: current state, then events as they come"""
+        try:
+            yield "retry: 5000\n\n"
+            if self.ready.wait(HEARTBEAT_SECONDS):
+                yield sse("state", self.state)
+            while not subscriber.dropped:
+                try:
+                    yield subscriber.queue.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def poll(self):
+        """
+        SSE body for a client over the limit: the current state, then the
+        stream ends. EventSource reconnects after `retry`, so the client polls
+        (from memory, like the streams) until a stream slot is free.
+        """
+        retry = random.uniform(EVENTS_POLL_SECONDS, 2 * EVENTS_POLL_SECONDS)
+        yield f"retry: {int(retry * 1000)}\n\n"
+        if self.ready.wait(HEARTBEAT_SECONDS):
+            yield sse("state", self.state)
+
+
+_brokers = []
+
+
+def _reset_after_fork():
+    # The listener thread doesn't survive a fork; the child starts its own on demand
+    for broker in _brokers:
+        broker.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def create_broker(snapshot):
+    broker = EventBroker(snapshot)
+    _brokers.append(broker)
+    return broker
@@ -0,0 +1,73 @@
+import io
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from utils.psql import transaction
+from utils.blobstore import get_blob_store
+
+# Square avatar sizes generated for every profile picture (pixels)
+AVATAR_SIZES = (64, 128, 512)
+
+# format -> (Pillow format, MIME type, save options)
+AVATAR_FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 85, "optimize": True, "progressive": True}),
+}
+
+
+def pick_avatar_size(requested):
+    """Smallest generated size that is at least `requested` (or the largest one)"""
+    return next((size for size in AVATAR_SIZES if size >= requested), AVATAR_SIZES[-1])
+
+
+def _save(img, fmt):
+    pil_format, mime, options = AVATAR_FORMATS[fmt]
+    if pil_format == "JPEG" and img.mode != "RGB":
+        # JPEG has no alpha, put transparent pictures on white
+        background = Image.new("RGB", img.size, "white")
+        background.paste(img, mask=img.getchannel("A") if "A" in img.getbands() else None)
+        img = background
+    out = io.BytesIO()
+    # No exif= argument, so metadata (GPS etc.) is stripped from the variants
+    img.save(out, pil_format, **options)
+    return out.getvalue(), mime
+
+
+def make_avatar_variants(path):
+    """
+    Resize the picture at `path` into square, EXIF-stripped avatars.
+    Returns a list of (size, format, mime, data); empty if Pillow can't read the file.
+    """
+    try:
+        with Image.open(path) as img:
+            # Let the JPEG decoder downscale while decoding, much cheaper for camera photos
+            img.draft("RGB", (AVATAR_SIZES[-1], AVATAR_SIZES[-1]))
+            img = ImageOps.exif_transpose(img)
+            img = img.convert("RGBA" if "A" in img.getbands() or img.mode == "P" else "RGB")
+
+            variants = []
+            for size in sorted(AVATAR_SIZES, reverse=True):
+                # Each size is made from the previous (bigger) one
+                img = ImageOps.fit(img, (size, size), Image.LANCZOS)
+                for fmt in AVATAR_FORMATS:
+                    data, mime = _save(img, fmt)
+                    variants.append((size, fmt, mime, data))
+            return variants
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return []
+
+
+def save_avatar_variants(user_id, digest):
+    """Resize a newly stored profile picture into the avatar sizes and record them"""
+    store = get_blob_store()
+    rows = []
+    for size, fmt, mime, data in make_avatar_variants(store.path(digest)):
+        blob = store.put_chunks([data])
+        rows.append((user_id, size, fmt, blob.digest, blob.size, mime))
+
+    with transaction() as tx:
+        tx.execute("DELETE FROM avatar_variants WHERE user_id = %s;", (user_id,), fetch=False)
+        if rows:
+            tx.execute_values(
+                "INSERT INTO avatar_variants (user_id, size, format, sha256, bytes, mime) VALUES %s;",
+                rows,
+            )
@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import random
+import traceback
+
+from utils.psql import psql
+
+logger = logging.getLogger("usainbolt.jobs")
+
+# Attempts before a job is dead-lettered (status 'dead', kept for inspection)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+# Retry delay after the n-th failure: JOB_BACKOFF_SECONDS * 2^(n-1), capped, with jitter
+JOB_BACKOFF_SECONDS = float(os.getenv("JOB_BACKOFF_SECONDS", "10"))
+JOB_BACKOFF_MAX_SECONDS = float(os.getenv("JOB_BACKOFF_MAX_SECONDS", "3600"))
+# A claimed job not finished within this time (crashed worker) is handed out again
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "600"))
+
+# kind -> (handler(payload), on_dead(payload) or None), filled by register()
+HANDLERS = {}
+
+
+def register(kind, on_dead=None):
+    """Decorator for a job handler; it gets the payload dict and must be safe to run twice"""
+    def decorator(handler):
+        HANDLERS[kind] = (handler, on_dead)
+        return handler
+    return decorator
+
+
+def enqueue(kind, payload, delay=0, max_attempts=JOB_MAX_ATTEMPTS):
+    """
+    Queue a job. Called inside transaction() it commits (or rolls back) together
+    with the rows it belongs to, so a job never refers to data that doesn't exist.
+    """
+    return psql("""
+        INSERT INTO jobs (kind, payload, max_attempts, run_after)
+        VALUES (%s, %s, %s, NOW() + make_interval(secs => %s))
+        RETURNING job_id;
+    """, (kind, json.dumps(payload), max_attempts, delay))[0]["job_id"]
+
+
+def claim(limit):
+    """
+    Take up to `limit` due jobs. SKIP LOCKED lets any number of workers claim
+    concurrently without blocking on, or double-claiming, each other's rows.
+    The lease pushes run_after forward, so a job of a crashed worker comes back.
+    A job that comes back with no attempts left (it killed its process or kept
+    running past the lease) is dead-lettered here, since run_job never got to.
+    """
+    rows = psql("""
+        WITH due AS (
+            SELECT job_id, attempts >= max_attempts AS exhausted
+            FROM jobs
+            WHERE status IN ('queued', 'running') AND run_after <= NOW()
+            ORDER BY run_after, job_id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE jobs j SET
+            status = CASE WHEN due.exhausted THEN 'dead' ELSE 'running' END,
+            attempts = j.attempts + CASE WHEN due.exhausted THEN 0 ELSE 1 END,
+            run_after = CASE WHEN due.exhausted THEN j.run_after ELSE NOW() + make_interval(secs => %s) END,
+            finished_at = CASE WHEN due.exhausted THEN NOW() END,
+            last_error = CASE WHEN due.exhausted THEN 'lease expired on the last attempt (worker died or job too slow)'
+                              ELSE j.last_error END
+        FROM due
+        WHERE j.job_id = due.job_id
+        RETURNING j.job_id, j.kind, j.payload, j.attempts, j.max_attempts, j.status;
+    """, (limit, JOB_LEASE_SECONDS))
+    jobs = []
+    for row in rows:
+        if row["status"] == "dead":
+            logger.warning("job %s (%s) never finished its last attempt, giving up", row["job_id"], row["kind"])
+            on_dead = HANDLERS.get(row["kind"], (None, None))[1]
+            try:
+                if on_dead is not None:
+                    on_dead(row["payload"])
+            except Exception:
+                logger.exception("on_dead handler of job %s failed", row["job_id"])
+        else:
+            jobs.append({key: row[key] for key in ("job_id", "kind", "payload", "attempts", "max_attempts")})
+    return jobs
+
+
+def release(jobs):
+    """Put claimed jobs that were never started back in the queue, without using up an attempt"""
+    for job in jobs:
+        psql(
+            "UPDATE jobs SET status = 'queued', attempts = attempts - 1, run_after = NOW() WHERE job_id = %s AND attempts = %s;",
+            (job["job_id"], job["attempts"]),
+            fetch=False,
+        )
+
+
+def backoff(attempts):
+    delay = min(JOB_BACKOFF_SECONDS * 2 ** (attempts - 1), JOB_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def run_job(job):
+    """Run one claimed job and record the outcome; returns the job's new status"""
+    handler, on_dead = HANDLERS.get(job["kind"], (None, None))
+    try:
+        if handler is None:
+            raise LookupError(f"no handler for job kind {job['kind']!r}")
+        handler(job["payload"])
+    except Exception:
+        error = traceback.format_exc(limit=5)
+        dead = job["attempts"] >= job["max_attempts"]
+        logger.warning("job %s (%s) attempt %s failed%s:\n%s", job["job_id"], job["kind"],
+                       job["attempts"], ", giving up" if dead else "", error)
+        # attempts guards against a job whose lease ran out and was claimed again
+        psql("""
+            UPDATE jobs SET status = %s, last_error = %s,
+                            run_after = NOW() + make_interval(secs => %s),
+                            finished_at = CASE WHEN %s THEN NOW() END
+            WHERE job_id = %s AND attempts = %s;
+        """, ("dead" if dead else "queued", error, backoff(job["attempts"]), dead,
+              job["job_id"], job["attempts"]), fetch=False)
+        if dead and on_dead is not None:
+            on_dead(job["payload"])
+        return "dead" if dead else "queued"
+
+    psql(
+        "UPDATE jobs SET status = 'done', finished_at = NOW(), last_error = NULL WHERE job_id = %s AND attempts = %s;",
+        (job["job_id"], job["attempts"]),
+        fetch=False,
+    )
+    return "done"
+
+
+def retry_dead(kind=None):
+    """Give dead-lettered jobs a fresh set of attempts, returns how many"""
+    rows = psql("""
+        UPDATE jobs SET status = 'queued', attempts = 0, run_after = NOW(), finished_at = NULL
+        WHERE status = 'dead' AND (%s IS NULL OR kind = %s)
+        RETURNING job_id;
+    """, (kind, kind))
+    return len(rows)
+
+
+def purge_finished(days):
+    """Delete successful jobs older than `days` (dead ones are kept)"""
+    rows = psql(
+        "DELETE FROM jobs WHERE status = 'done' AND finished_at < NOW() - make_interval(days => %s) RETURNING job_id;",
+        (days,),
+    )
+    return len(rows)
+
+
+def queue_stats():
+    """Number of jobs per status"""
+    rows = psql("SELECT status, COUNT(*) AS jobs FROM jobs GROUP BY status;")
+    return {status: 0 for status in ("queued", "running", "done", "dead")} | {row["status"]: row["jobs"] for row in rows}
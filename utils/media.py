@@ -0,0 +1,113 @@
+import os
+
+from flask import Response, request
+from utils.psql import psql
+
+# Size of each slice fetched from Postgres while streaming a video
+VIDEO_CHUNK_SIZE = 256 * 1024
+
+# Cache lifetime for media URLs without a ?v= content version
+MEDIA_MAX_AGE = int(os.getenv("MEDIA_MAX_AGE", "300"))
+
+# Versioned media URLs never change content, so they can be cached for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Length of the digest prefix used as ?v= in media URLs
+VERSION_LENGTH = 16
+
+
+def media_version(digest):
+    """Short content version for a media URL (?v=...), or None if there's no digest yet"""
+    return digest[:VERSION_LENGTH] if digest else None
+
+
+def not_modified(etag, last_modified=None, version=None, immutable=True):
+    """
+    Answer a conditional GET from metadata alone.
+    Returns a 304 response if the client's copy is current, otherwise None.
+    """
+    if request.if_none_match:
+        # If-None-Match wins over If-Modified-Since when both are sent
+        if not request.if_none_match.contains(etag):
+            return None
+    elif not (last_modified and request.if_modified_since
+              and last_modified.replace(microsecond=0) <= request.if_modified_since):
+        return None
+
+    response = Response(status=304)
+    set_cache_headers(response, etag, last_modified, version, immutable)
+    return response
+
+
+def set_cache_headers(response, etag, last_modified=None, version=None, immutable=True):
+    """
+    Attach a strong ETag, Last-Modified and Cache-Control to a media response.
+    `version` is the digest the ?v= in the URL is derived from (defaults to the ETag).
+    immutable=False for a stand-in that the same URL will serve differently later.
+    """
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.no_cache = None  # send_file defaults to no-cache
+    if immutable and request.args.get("v") == media_version(version or etag):
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = MEDIA_MAX_AGE
+    return response
+
+
+def iter_video_chunks(run_id, start, length, chunk_size=VIDEO_CHUNK_SIZE):
+    """
+    Yield `length` bytes of runs.video_data starting at byte `start`,
+    one substring() query per chunk so only chunk_size bytes are held at a time.
+    """
+    offset = start
+    end = start + length
+    while offset < end:
+        size = min(chunk_size, end - offset)
+        rows = psql(
+            "SELECT substring(video_data FROM %s FOR %s) AS chunk FROM runs WHERE run_id = %s;",
+            (offset + 1, size, run_id),  # substring() is 1-based
+        )
+        if not rows or rows[0]["chunk"] is None:
+            return
+        chunk = bytes(rows[0]["chunk"])
+        if not chunk:
+            return
+        yield chunk
+        offset += len(chunk)
+
+
+def stream_video(run_id, total_size, mimetype):
+    """
+    Build a streaming response for a stored video, answering Range requests
+    with 206 Partial Content and plain GETs with the whole file in chunks.
+    """
+    byte_range = request.range
+    status = 200
+    start, stop = 0, total_size
+
+    if byte_range is not None:
+        bounds = byte_range.range_for_length(total_size)
+        if bounds is None:
+            response = Response(status=416)
+            response.headers["Content-Range"] = f"bytes */{total_size}"
+            response.headers["Accept-Ranges"] = "bytes"
+            return response
+        start, stop = bounds
+        status = 206
+
+    length = stop - start
+    response = Response(
+        iter_video_chunks(run_id, start, length),
+        status=status,
+        mimetype=mimetype,
+        direct_passthrough=True,
+    )
+    response.headers["Accept-Ranges"] = "bytes"
+    response.headers["Content-Length"] = str(length)
+    if status == 206:
+        response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{total_size}"
+    return response
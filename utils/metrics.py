@@ -0,0 +1,160 @@
+import logging
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+
+from flask import g, has_request_context, request
+
+logger = logging.getLogger("usainbolt.sql")
+
+# Queries slower than this are logged with their normalized statement
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative latency histogram in the Prometheus style"""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+
+
+class Metrics:
+    """
+    In-process counters for this worker: latency per normalized SQL statement
+    and per route. Each gunicorn worker keeps its own, scrape them all.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = {}    # statement -> Histogram
+        self.routes = {}     # (endpoint, method) -> Histogram
+        self.responses = {}  # (endpoint, method, status) -> count
+        self.slow_queries = 0
+
+    def observe_query(self, statement, seconds):
+        with self.lock:
+            self.queries.setdefault(statement, Histogram()).observe(seconds)
+            if seconds * 1000 >= SLOW_QUERY_MS:
+                self.slow_queries += 1
+
+    def observe_request(self, endpoint, method, status, seconds):
+        with self.lock:
+            self.routes.setdefault((endpoint, method), Histogram()).observe(seconds)
+            key = (endpoint, method, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+
+metrics = Metrics()
+
+
+@lru_cache(maxsize=1024)
+def normalize_statement(query):
+    """One-line statement with literals replaced, used as the metric label"""
+    statement = " ".join(query.split())
+    statement = re.sub(r"'(?:[^']|'')*'", "?", statement)
+    statement = re.sub(r"\b\d+(?:\.\d+)?\b", "?", statement)
+    return statement[:300]
+
+
+def record_query(query, seconds):
+    """Called by utils.psql for every statement it runs"""
+    statement = normalize_statement(query if isinstance(query, str) else query.decode())
+    metrics.observe_query(statement, seconds)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        logger.warning("slow query (%.1f ms): %s", seconds * 1000, statement)
+    if has_request_context():
+        g.db_queries = g.get("db_queries", 0) + 1
+        g.db_time = g.get("db_time", 0.0) + seconds
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.db_queries = 0
+    g.db_time = 0.0
+
+
+def _finish_request(response):
+    started = g.get("request_started")
+    if started is None:
+        return response
+    total = time.perf_counter() - started
+    db_time = g.get("db_time", 0.0)
+    response.headers.add(
+        "Server-Timing",
+        f'db;dur={db_time * 1000:.1f};desc="{g.get("db_queries", 0)} queries", app;dur={total * 1000:.1f}',
+    )
+    metrics.observe_request(request.endpoint or "unknown", request.method, response.status_code, total)
+    return response
+
+
+def init_app(app):
+    """Time every request, count its queries and report them in a Server-Timing header"""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+def _labels(**labels):
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _histogram_lines(name, labels, hist):
+    lines = []
+    for bound, count in zip(BUCKETS, hist.counts):
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {count}")
+    lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {hist.count}')
+    lines.append(f"{name}_sum{_labels(**labels)} {hist.sum:.6f}")
+    lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+    return lines
+
+
+def render_prometheus(extra_gauges=None):
+    """All metrics of this worker in the Prometheus text exposition format"""
+    lines = [
+        "# HELP usainbolt_request_duration_seconds Request latency per route.",
+        "# TYPE usainbolt_request_duration_seconds histogram",
+    ]
+    with metrics.lock:
+        for (endpoint, method), hist in sorted(metrics.routes.items()):
+            lines += _histogram_lines("usainbolt_request_duration_seconds", {"endpoint": endpoint, "method": method}, hist)
+
+        lines += [
+            "# HELP usainbolt_responses_total Responses per route and status.",
+            "# TYPE usainbolt_responses_total counter",
+        ]
+        for (endpoint, method, status), count in sorted(metrics.responses.items()):
+            lines.append(f"usainbolt_responses_total{_labels(endpoint=endpoint, method=method, status=status)} {count}")
+
+        lines += [
+            "# HELP usainbolt_query_duration_seconds SQL latency per normalized statement.",
+            "# TYPE usainbolt_query_duration_seconds histogram",
+        ]
+        for statement, hist in sorted(metrics.queries.items()):
+            lines += _histogram_lines("usainbolt_query_duration_seconds", {"statement": statement}, hist)
+
+        lines += [
+            "# HELP usainbolt_slow_queries_total Queries slower than SLOW_QUERY_MS.",
+            "# TYPE usainbolt_slow_queries_total counter",
+            f"usainbolt_slow_queries_total {metrics.slow_queries}",
+        ]
+
+    for name, value in (extra_gauges or {}).items():
+        lines += [f"# TYPE usainbolt_{name} gauge", f"usainbolt_{name} {value}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,215 @@
+import logging
+import struct
+from collections import namedtuple
+
+from utils.blobstore import get_blob_store
+
+logger = logging.getLogger("usainbolt.mp4")
+
+# Uploads with an ISO base media (ftyp) container, see utils.uploads.sniff_mime
+MP4_MIMETYPES = {"video/mp4", "video/quicktime", "video/3gpp"}
+
+# Boxes inside moov that have to be descended into to reach the chunk offset tables
+CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+VideoInfo = namedtuple("VideoInfo", "duration width height")
+
+
+class Mp4Error(ValueError):
+    """Not a (well-formed) MP4/QuickTime file"""
+
+
+def iter_boxes(f, end):
+    """(type, offset, size) of the top-level boxes of file f, up to byte `end`"""
+    offset = 0
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset  # extends to the end of the file
+        if size < header_size or offset + size > end:
+            raise Mp4Error(f"bad size for box {kind!r} at offset {offset}")
+        yield kind, offset, size
+        offset += size
+
+
+def parse_boxes(data):
+    """Parse moov (without its header) into a tree of [type, payload bytes or child list]"""
+    boxes = []
+    offset = 0
+    while offset < len(data):
+        if offset + 8 > len(data):
+            raise Mp4Error("truncated box in moov")
+        size, kind = struct.unpack_from(">I4s", data, offset)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header_size = 16
+        if size < header_size or offset + size > len(data):
+            raise Mp4Error(f"bad size for box {kind!r} in moov")
+        payload = data[offset + header_size:offset + size]
+        boxes.append([kind, parse_boxes(payload) if kind in CONTAINERS else payload])
+        offset += size
+    return boxes
+
+
+def serialize_boxes(boxes):
+    out = bytearray()
+    for kind, value in boxes:
+        payload = serialize_boxes(value) if isinstance(value, list) else value
+        out += struct.pack(">I4s", len(payload) + 8, kind) + payload
+    return bytes(out)
+
+
+def _walk(boxes, kind):
+    """Every box of the given type in the tree, depth first"""
+    for box in boxes:
+        if box[0] == kind:
+            yield box
+        if isinstance(box[1], list):
+            yield from _walk(box[1], kind)
+
+
+def _child(boxes, *path):
+    """Payload of the box at path, e.g. _child(trak, b"mdia", b"hdlr"), or None"""
+    for kind in path:
+        match = next((value for box_kind, value in boxes if box_kind == kind), None)
+        if match is None:
+            return None
+        boxes = match
+    return boxes
+
+
+def _chunk_offsets(box):
+    fmt = "I" if box[0] == b"stco" else "Q"
+    count = struct.unpack_from(">I", box[1], 4)[0]
+    return list(struct.unpack_from(f">{count}{fmt}", box[1], 8))
+
+
+def _set_chunk_offsets(box, offsets, kind=None):
+    box[0] = kind or box[0]
+    fmt = "I" if box[0] == b"stco" else "Q"
+    box[1] = box[1][:8] + struct.pack(f">{len(offsets)}{fmt}", *offsets)
+
+
+def video_info(moov):
+    """Duration (seconds) from mvhd, display width/height from the first video track"""
+    mvhd = _child(moov, b"mvhd")
+    if mvhd is None:
+        raise Mp4Error("moov without mvhd")
+    if mvhd[0] == 1:
+        timescale, duration = struct.unpack_from(">IQ", mvhd, 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", mvhd, 12)
+    seconds = duration / timescale if timescale else None
+
+    width = height = None
+    for _, trak in _walk(moov, b"trak"):
+        hdlr = _child(trak, b"mdia", b"hdlr")
+        tkhd = _child(trak, b"tkhd")
+        if hdlr is None or tkhd is None or hdlr[8:12] != b"vide" or len(tkhd) < 44:
+            continue
+        # Transformation matrix (a, b, u, c, d, v, x, y, w), then 16.16 width and height
+        matrix = struct.unpack(">9i", tkhd[-44:-8])
+        width, height = (value >> 16 for value in struct.unpack(">II", tkhd[-8:]))
+        if matrix[0] == 0 and matrix[4] == 0:
+            width, height = height, width  # rotated by 90/270 degrees (portrait phone videos)
+        break
+    return VideoInfo(seconds, width, height)
+
+
+def faststart(f, file_size):
+    """
+    Read the MP4 in file f and return (info, chunks).
+    If moov comes after the media data, `chunks` iterates over a rewritten file
+    with moov right before the first mdat and every stco/co64 chunk offset
+    moved along (stco tables become co64 if offsets outgrow 32 bits);
+    otherwise it is None and the file can be kept as it is.
+    """
+    boxes = list(iter_boxes(f, file_size))
+    moov = next(((offset, size) for kind, offset, size in boxes if kind == b"moov"), None)
+    first_mdat = next((offset for kind, offset, _ in boxes if kind == b"mdat"), None)
+    if moov is None:
+        raise Mp4Error("no moov box")
+    moov_offset, moov_size = moov
+
+    f.seek(moov_offset)
+    header = f.read(16)
+    header_size = 16 if struct.unpack_from(">I", header)[0] == 1 else 8
+    f.seek(moov_offset + header_size)
+    tree = parse_boxes(f.read(moov_size - header_size))
+    if _child(tree, b"cmov") is not None:
+        raise Mp4Error("compressed moov is not supported")
+    info = video_info(tree)
+
+    if first_mdat is None or moov_offset < first_mdat:
+        return info, None  # already playable from the start
+
+    tables = list(_walk(tree, b"stco")) + list(_walk(tree, b"co64"))
+    new_size = len(serialize_boxes(tree)) + 8
+    largest = max((max(_chunk_offsets(box), default=0) for box in tables), default=0)
+    if largest + new_size > 0xFFFFFFFF:
+        for box in tables:
+            if box[0] == b"stco":
+                _set_chunk_offsets(box, _chunk_offsets(box), b"co64")
+        new_size = len(serialize_boxes(tree)) + 8
+
+    moov_end = moov_offset + moov_size
+
+    def moved(offset):
+        if offset < first_mdat:
+            return offset
+        if offset < moov_offset:
+            return offset + new_size  # everything from the first mdat on moves behind moov
+        if offset >= moov_end:
+            return offset + new_size - moov_size
+        raise Mp4Error("chunk offset points into moov")
+
+    for box in tables:
+        _set_chunk_offsets(box, [moved(offset) for offset in _chunk_offsets(box)])
+    new_moov = struct.pack(">I4s", new_size, b"moov") + serialize_boxes(tree)
+
+    def chunks():
+        yield from _copy_range(f, 0, first_mdat)
+        yield new_moov
+        yield from _copy_range(f, first_mdat, moov_offset)
+        yield from _copy_range(f, moov_end, file_size)
+
+    return info, chunks()
+
+
+def _copy_range(f, start, end):
+    f.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        data = f.read(min(COPY_CHUNK_SIZE, remaining))
+        if not data:
+            raise Mp4Error("file ended early")
+        remaining -= len(data)
+        yield data
+
+
+def faststart_blob(blob, mimetype):
+    """
+    Make an uploaded MP4 video stream-friendly. Returns (blob, info): the
+    rewritten blob (or the same one if nothing had to move) and its VideoInfo.
+    Files that can't be parsed are kept unchanged with info None.
+    """
+    if mimetype not in MP4_MIMETYPES:
+        return blob, None
+    store = get_blob_store()
+    try:
+        with open(store.path(blob.digest), "rb") as f:
+            info, chunks = faststart(f, blob.size)
+            if chunks is not None:
+                blob = store.put_chunks(chunks)
+    except (Mp4Error, struct.error) as e:
+        logger.info("not rewriting video %s: %s", blob.digest, e)
+        return blob, None
+    return blob, info
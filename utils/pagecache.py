@@ -0,0 +1,205 @@
+import inspect
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+
+logger = logging.getLogger("usainbolt.cache")
+
+# Seconds a cached page is served as fresh, 0 turns the cache off
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "5"))
+# Seconds after that it may still be served while it is re-rendered in the background
+PAGE_CACHE_STALE = float(os.getenv("PAGE_CACHE_STALE", "30"))
+# Most pages kept per worker, least recently used go first
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "1000"))
+
+Entry = namedtuple("Entry", "body status headers tags expires")
+
+# Per-request headers that must not be replayed to other clients
+UNCACHED_HEADERS = {"set-cookie", "server-timing"}
+
+
+class PageCache:
+    """
+    In-process cache of rendered pages for anonymous GET requests.
+
+    Pages are keyed by endpoint, path and query string and carry tags
+    ("runs", "user:<id>") that the write routes invalidate. Each gunicorn worker
+    has its own cache, so another worker's write shows up there after at most
+    PAGE_CACHE_TTL seconds (plus one stale hit while it re-renders).
+    """
+
+    def __init__(self, ttl=PAGE_CACHE_TTL, stale=PAGE_CACHE_STALE, max_entries=PAGE_CACHE_SIZE):
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> Entry, in LRU order
+        self.tags = {}                # tag -> set of keys
+        self.refreshing = set()
+        # Bumped by every invalidation; renders started before it are not stored
+        self.generation = 0
+        self.counters = {"hits": 0, "stale_hits": 0, "misses": 0, "bypassed": 0, "evictions": 0, "invalidations": 0,
+                         "memo_hits": 0, "memo_misses": 0}
+
+    def cached(self, *tags):
+        """
+        Decorator for a read-only view. Tags may use the view's arguments,
+        e.g. @page_cache.cached("user:{user_id}").
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                if not self.ttl or request.method != "GET" or not _anonymous():
+                    self._count("bypassed")
+                    return view(**kwargs)
+
+                key = (request.endpoint, request.path, tuple(sorted(request.args.items(multi=True))))
+                entry_tags = {tag.format(**kwargs) for tag in tags}
+                now = time.monotonic()
+                with self.lock:
+                    entry = self.entries.get(key)
+                    if entry is not None and now < entry.expires + self.stale:
+                        self.entries.move_to_end(key)
+                        fresh = now < entry.expires
+                        self.counters["hits" if fresh else "stale_hits"] += 1
+                        if not fresh and key not in self.refreshing:
+                            self.refreshing.add(key)
+                            self._refresh_later(key, view, kwargs, entry_tags)
+                    else:
+                        entry = None
+                        self.counters["misses"] += 1
+                        generation = self.generation
+
+                if entry is not None:
+                    response = current_app.response_class(entry.body, entry.status, entry.headers)
+                    response.headers["X-Cache"] = "HIT" if fresh else "STALE"
+                    return response
+
+                response = make_response(view(**kwargs))
+                self._store(key, response, entry_tags, generation)
+                response.headers["X-Cache"] = "MISS"
+                return response
+            return wrapper
+        return decorator
+
+    def memoize(self, *tags, ttl=None):
+        """
+        Decorator caching a function's return value with the same tags as the
+        pages, e.g. @page_cache.memoize("user:{user_id}", ttl=60). The value is
+        shared between callers, so it must not be modified. Like the pages it is
+        per worker, and PAGE_CACHE_TTL=0 turns it off too.
+        """
+        def decorator(func):
+            signature = inspect.signature(func)
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                lifetime = self.ttl if ttl is None else ttl
+                if not self.ttl or not lifetime:
+                    return func(*args, **kwargs)
+                arguments = signature.bind(*args, **kwargs).arguments
+                key = (func.__qualname__, tuple(arguments.items()))
+                now = time.monotonic()
+                with self.lock:
+                    entry = self.entries.get(key)
+                    if entry is not None and now < entry.expires:
+                        self.entries.move_to_end(key)
+                        self.counters["memo_hits"] += 1
+                        return entry.body
+                    self.counters["memo_misses"] += 1
+                    generation = self.generation
+                value = func(*args, **kwargs)
+                entry_tags = {tag.format(**arguments) for tag in tags}
+                self._put(key, Entry(value, None, None, entry_tags, now + lifetime), generation)
+                return value
+            return wrapper
+        return decorator
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _store(self, key, response, tags, generation):
+        if response.status_code != 200 or response.is_streamed or "Set-Cookie" in response.headers:
+            return
+        headers = [(k, v) for k, v in response.headers.items() if k.lower() not in UNCACHED_HEADERS]
+        self._put(key, Entry(response.get_data(), response.status_code, headers, tags, time.monotonic() + self.ttl), generation)
+
+    def _put(self, key, entry, generation):
+        with self.lock:
+            if generation != self.generation:
+                return  # invalidated while rendering, the page may be outdated already
+            self._remove(key)
+            self.entries[key] = entry
+            for tag in entry.tags:
+                self.tags.setdefault(tag, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+                self.counters["evictions"] += 1
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            for tag in entry.tags:
+                keys = self.tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.tags[tag]
+
+    def _refresh_later(self, key, view, kwargs, tags):
+        """Re-render a stale page in a background thread (called with the lock held)"""
+        app = current_app._get_current_object()
+        path, query_string, base_url = request.path, request.query_string, request.host_url
+        generation = self.generation
+
+        def run():
+            try:
+                with app.test_request_context(path, base_url=base_url, query_string=query_string):
+                    self._store(key, make_response(view(**kwargs)), tags, generation)
+            except Exception:
+                logger.exception("refreshing cached page %s failed", path)
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def invalidate(self, *tags):
+        """Drop every page carrying any of these tags (call after a write)"""
+        with self.lock:
+            self.generation += 1
+            self.counters["invalidations"] += 1
+            for tag in tags:
+                for key in list(self.tags.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.counters["invalidations"] += 1
+            self.entries.clear()
+            self.tags.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["stale_hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "entries": len(self.entries),
+                "bytes": sum(len(entry.body) for entry in self.entries.values() if entry.status is not None),
+                "hit_ratio": round((self.counters["hits"] + self.counters["stale_hits"]) / lookups, 3) if lookups else None,
+            }
+
+
+def _anonymous():
+    """Admins and pages with pending flash messages get a freshly rendered page"""
+    return not session.get("admin_logged_in") and "_flashes" not in session
+
+
+page_cache = PageCache()
@@ -0,0 +1,74 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from utils.psql import psql
+
+# How long a worker trusts its cached state before checking the version row again
+SITE_STATE_TTL = float(os.getenv("SITE_STATE_TTL", "1.0"))
+
+DEFAULT_CONFIG = {"goal": 100}
+
+
+class SiteState:
+    """
+    Per-process cache of the total run count and config.json.
+
+    The site_state row holds the run counter (kept by triggers on runs) and a
+    config version bumped by save_config(). A worker re-reads that one row at
+    most every `ttl` seconds and only re-parses config.json when the version
+    moved, so the index page normally costs no query and no file read.
+    """
+
+    def __init__(self, config_file, ttl=SITE_STATE_TTL):
+        self.config_file = Path(config_file)
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.checked_at = None
+        self.total_runs = 0
+        self.config_version = None
+        self.config = None
+
+    def _refresh(self):
+        rows = psql("SELECT runs_total, config_version FROM site_state WHERE id = 1;")
+        if rows:
+            total_runs, config_version = rows[0]["runs_total"], rows[0]["config_version"]
+        else:
+            # Row not created yet (older database), count the slow way
+            total_runs, config_version = psql("SELECT COUNT(*) FROM runs;")[0][0], 0
+        if config_version != self.config_version or self.config is None:
+            self.config = self._read_config()
+            self.config_version = config_version
+        self.total_runs = total_runs
+        self.checked_at = time.monotonic()
+
+    def _read_config(self):
+        if self.config_file.exists():
+            return json.loads(self.config_file.read_text())
+        return dict(DEFAULT_CONFIG)
+
+    def _current(self):
+        with self.lock:
+            if self.checked_at is None or time.monotonic() - self.checked_at > self.ttl:
+                self._refresh()
+            return self.total_runs, self.config
+
+    def get_total_runs(self):
+        return self._current()[0]
+
+    def get_config(self):
+        return dict(self._current()[1])
+
+    def save_config(self, config):
+        self.config_file.write_text(json.dumps(config, indent=2))
+        psql("UPDATE site_state SET config_version = config_version + 1 WHERE id = 1;", fetch=False)
+        with self.lock:
+            self.checked_at = None
+            self.config = None
+
+    def invalidate(self):
+        """Force the next read to go to the database (called after run writes in this worker)"""
+        with self.lock:
+            self.checked_at = None
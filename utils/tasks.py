@@ -0,0 +1,52 @@
+from utils.psql import psql
+from utils.jobs import register
+from utils.blobstore import BlobRef
+from utils.mp4 import faststart_blob
+from utils.images import save_avatar_variants
+
+# Job handlers run by worker.py. Each one re-checks that the row still points
+# at the blob it was queued for, so a retried or outdated job is harmless.
+
+
+def _video_failed(payload):
+    psql(
+        "UPDATE runs SET processing_status = 'failed' WHERE run_id = %s AND video_sha256 = %s;",
+        (payload["run_id"], payload["digest"]),
+        fetch=False,
+    )
+
+
+@register("process_video", on_dead=_video_failed)
+def process_video(payload):
+    """Faststart-rewrite an uploaded video and store its duration and size"""
+    run_id, digest = payload["run_id"], payload["digest"]
+    rows = psql("""
+        UPDATE runs SET processing_status = 'processing'
+        WHERE run_id = %s AND video_sha256 = %s
+        RETURNING video_size, video_mime;
+    """, (run_id, digest))
+    if not rows:
+        return  # run deleted or given another video since
+
+    blob, info = faststart_blob(BlobRef(digest, rows[0]["video_size"]), rows[0]["video_mime"])
+    duration, width, height = info or (None, None, None)
+    psql("""
+        UPDATE runs SET video_sha256 = %s, video_size = %s,
+                        video_duration = %s, video_width = %s, video_height = %s,
+                        video_updated_at = CASE WHEN %s THEN video_updated_at ELSE NOW() END,
+                        processing_status = 'ready'
+        WHERE run_id = %s AND video_sha256 = %s;
+    """, (blob.digest, blob.size, duration, width, height, blob.digest == digest, run_id, digest), fetch=False)
+
+
+@register("avatar_variants")
+def avatar_variants(payload):
+    """Resize a new profile picture into the avatar sizes"""
+    user_id, digest = payload["user_id"], payload["digest"]
+    current = psql(
+        "SELECT 1 FROM users WHERE user_id = %s AND profile_picture_sha256 = %s;",
+        (user_id, digest),
+        replica=False,  # the user may have been committed a moment ago
+    )
+    if current:
+        save_avatar_variants(user_id, digest)
@@ -0,0 +1,140 @@
+import hashlib
+import os
+
+from flask import Request, abort
+from PIL import Image
+from werkzeug.exceptions import RequestEntityTooLarge
+from utils.blobstore import get_blob_store
+
+# Largest accepted upload (whole request and each file), configurable from .env
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "500")) * 1024 * 1024
+
+# Bytes kept from the start of each upload for content sniffing
+HEAD_SIZE = 64
+
+
+def _decodable_images():
+    Image.init()
+    return {Image.MIME[fmt] for fmt in Image.OPEN if Image.MIME.get(fmt, "").startswith("image/")}
+
+
+# Image types the installed Pillow can open; avatars are resized with it, so others
+# (e.g. HEIC without a plugin) are refused at upload instead of failing in the worker
+DECODABLE_IMAGES = _decodable_images()
+
+
+class IngestFile:
+    """
+    Write target for an uploaded file part.
+    The multipart parser writes the request body into it chunk by chunk; the
+    data goes straight to a temp file inside the blob store while the SHA-256,
+    size and first bytes are collected on the way, so storing it afterwards is
+    just a rename.
+    """
+
+    def __init__(self, max_size=MAX_UPLOAD_BYTES):
+        self.store = get_blob_store()
+        self.file = self.store.temp_file()
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+        self.max_size = max_size
+        self.stored = None
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise RequestEntityTooLarge()
+        if len(self.head) < HEAD_SIZE:
+            self.head += data[:HEAD_SIZE - len(self.head)]
+        self.hasher.update(data)
+        return self.file.write(data)
+
+    def read(self, *args):
+        return self.file.read(*args)
+
+    def readline(self, *args):
+        return self.file.readline(*args)
+
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+    def tell(self):
+        return self.file.tell()
+
+    def store_blob(self):
+        """Move the upload into the blob store and return its BlobRef"""
+        if self.stored is None:
+            self.file.close()
+            self.stored = self.store.adopt(self.file.name, self.hasher.hexdigest(), self.size)
+        return self.stored
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+        if self.stored is None and os.path.exists(self.file.name):
+            os.unlink(self.file.name)
+
+
+class IngestRequest(Request):
+    """Request class that streams uploaded files into IngestFile instead of memory/tmp"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return IngestFile()
+
+
+def sniff_mime(head):
+    """Detect the real content type of an upload from its magic bytes"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "video/x-msvideo"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "video/webm"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand == b"qt  ":
+            return "video/quicktime"
+        if brand in (b"heic", b"heix", b"mif1", b"msf1"):
+            return "image/heic"
+        if brand in (b"avif", b"avis"):
+            return "image/avif"
+        if brand.startswith(b"3g"):
+            return "video/3gpp"
+        return "video/mp4"
+    if head[4:8] in (b"moov", b"mdat", b"wide", b"free", b"skip"):
+        # Older QuickTime files start straight with an atom instead of ftyp
+        return "video/quicktime"
+    return None
+
+
+def ingest_upload(file, kind):
+    """
+    Store an uploaded FileStorage in the blob store and return (BlobRef, mimetype).
+    `kind` is "video" or "image"; uploads that are sniffed as something else get a 415.
+    """
+    stream = file.stream
+    if isinstance(stream, IngestFile):
+        head = stream.head
+    else:
+        head = stream.read(HEAD_SIZE)
+        stream.seek(0)
+
+    # Only the content counts, never the filename: anything that isn't recognized is refused
+    mimetype = sniff_mime(head)
+    if not mimetype or not mimetype.startswith(kind + "/"):
+        abort(415, f"Upload is not a valid {kind} file")
+    if kind == "image" and mimetype not in DECODABLE_IMAGES:
+        abort(415, f"{mimetype} pictures are not supported")
+
+    if isinstance(stream, IngestFile):
+        blob = stream.store_blob()
+    else:
+        blob = get_blob_store().put(stream)
+    return blob, mimetype
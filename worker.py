@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Run queued background jobs (video faststart, avatar resizing) from the jobs table
+
+Any number of workers can run side by side, on any machine that reaches the
+database and the blob store. Jobs are claimed with SELECT ... FOR UPDATE SKIP
+LOCKED, failed ones are retried with exponential backoff and dead-lettered
+after JOB_MAX_ATTEMPTS. Stop with Ctrl-C / SIGTERM: running jobs are finished first.
+
+Run: python3 worker.py [--concurrency 4] [--pool thread|process] [--once] [--retry-dead]
+"""
+import argparse
+import logging
+import multiprocessing
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import utils.tasks  # noqa: F401 (registers the job handlers)
+from utils.jobs import claim, release, run_job, retry_dead, purge_finished
+
+# Successful jobs are deleted after this many days
+JOB_RETENTION_DAYS = 7
+PURGE_EVERY_SECONDS = 3600
+
+logger = logging.getLogger("usainbolt.worker")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=4, help="jobs run at the same time")
+    parser.add_argument("--pool", choices=["thread", "process"], default="thread",
+                        help="process: CPU-heavy jobs don't contend for the GIL")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between checks when idle")
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    parser.add_argument("--retry-dead", action="store_true", help="requeue dead-lettered jobs first")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.retry_dead:
+        print(f"Requeued {retry_dead()} dead jobs.")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    def make_executor():
+        if args.pool == "process":
+            # fork: children inherit the registered handlers, utils.psql gives them fresh pools
+            # (Ctrl-C is handled here, the children just finish their current job)
+            return ProcessPoolExecutor(
+                args.concurrency,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=signal.signal,
+                initargs=(signal.SIGINT, signal.SIG_IGN),
+            )
+        return ThreadPoolExecutor(args.concurrency, thread_name_prefix="job")
+
+    executor = make_executor()
+    in_flight = {}  # future -> executor it runs in
+    purged_at = 0.0
+    done = 0
+    try:
+        while not stopping:
+            try:
+                if time.monotonic() - purged_at > PURGE_EVERY_SECONDS:
+                    purge_finished(JOB_RETENTION_DAYS)
+                    purged_at = time.monotonic()
+                jobs = claim(args.concurrency - len(in_flight)) if len(in_flight) < args.concurrency else []
+            except Exception as e:
+                # Database unreachable: keep the running jobs going and try again
+                logger.warning("claiming jobs failed: %s", e)
+                jobs = []
+            broken = None
+            for i, job in enumerate(jobs):
+                try:
+                    in_flight[executor.submit(run_job, job)] = executor
+                except BrokenExecutor:
+                    # A process of the pool died (segfault, OOM kill); hand the rest back right away
+                    release(jobs[i:])
+                    broken = executor
+                    break
+
+            if in_flight:
+                finished, _ = wait(in_flight, timeout=0 if jobs else args.poll_interval, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    pool = in_flight.pop(future)
+                    error = future.exception()
+                    if isinstance(error, BrokenExecutor):
+                        # The job's outcome is unknown; its lease runs out and it is retried (or dead-lettered)
+                        logger.error("job process died, the job is retried after its lease")
+                        broken = broken or (pool if pool is executor else None)
+                    elif error is not None:
+                        # run_job records job failures itself, this is only for errors recording them
+                        logger.error("job runner failed", exc_info=error)
+                    done += 1
+            elif args.once and not jobs:
+                break
+            elif not jobs:
+                time.sleep(args.poll_interval)
+
+            if broken is not None:
+                logger.error("job pool is broken, starting a new one")
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = make_executor()
+
+        wait(in_flight)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    print(f"Stopped after {done} jobs.")
+
+
+if __name__ == "__main__":
+    main()